@@ -1,22 +1,27 @@
 import os
 import sys
+import argparse
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-import yaml
-import json
+from typing import List, Dict, Any, Optional, Set, Tuple
+import orjson
+import numpy as np
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 from datetime import datetime
 import importlib
 
-from vector_db import SimpleVectorDB
+from vector_db import SimpleVectorDB, normalize_rows, recommended_ef_search
+# System prompt is parsed from configs/prompts.yml on first use; the user prompt text
+# lives in utils so test_query.py builds exactly the same prompts
+from utils import get_system_prompt, _is_failed_response, build_context_prompt, NO_CONTEXT_PROMPT
 
-# Load prompt from YAML file
-_prompts_path = Path(__file__).resolve().parents[1] / "configs" / "prompts.yml"
-with open(_prompts_path, "r", encoding="utf-8") as _f:
-    _prompts = yaml.safe_load(_f)
 
-SYSTEM_PROMPT: str = _prompts["be_my_ai_prompt"]
+def __getattr__(name: str) -> Any:
+    # Keeps `from evaluate_validation_dataset import SYSTEM_PROMPT` working without an import-time load
+    if name == "SYSTEM_PROMPT":
+        return get_system_prompt()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Evaluation Configuration
 EVALUATION_CONFIG = {
@@ -25,8 +30,13 @@ EVALUATION_CONFIG = {
     "without_context": True,
     "top_k_similar": 4,
     "max_validation_samples": 100,
+    "max_workers": 8,  # Number of model requests kept in flight at once
 }
 
+# Results are buffered in memory and flushed to the JSONL file every N records
+RESULTS_WRITE_BUFFER = 1 << 20
+RESULTS_FLUSH_EVERY = 32
+
 # Model Configurations
 MODEL_CONFIGS: List[Dict[str, str]] = [
     {"name": "gemini-2.5-pro", "provider": "gemini", "model": "gemini-2.5-pro"},
@@ -46,6 +56,8 @@ class ValidationEvaluator:
         
         ## Change later to adapt based on embeddings provider
         self.train_collection_name = f"vizwiz_500_sample_cosine"
+        # Load the index in the background while embeddings and models are prepared
+        self.db.warm_up(self.train_collection_name)
         
         print(f"Using embedding provider: {self.embedding_provider.upper()}")
         print(f"Train collection: {self.train_collection_name}")
@@ -54,15 +66,27 @@ class ValidationEvaluator:
         if not self.validation_embeddings:
             raise FileNotFoundError("Could not load validation embeddings file.")
 
-        self.validation_ids = [str(item['id']) for item in self.validation_embeddings.get("items", [])]
+        items = self.validation_embeddings.get("items", [])
+        self._items_by_id = {str(item["id"]): item for item in items}
+        self.validation_ids = list(self._items_by_id)
+        self._emb_by_id = self._index_embeddings(items)
+        # validation_id -> search result; every model queries the same neighbours for an ID
+        self._similar_cache: Dict[str, Dict[str, Any]] = {}
         
         sys.path.append(os.path.dirname(__file__))
         
-        visual_interpreter = importlib.import_module("visual_interpreter")
-        self.models = visual_interpreter.create_models(MODEL_CONFIGS)
+        # Provider SDKs are heavy to import; they are loaded on first use by run_evaluation
+        self.models: Optional[Dict[str, Any]] = None
         
         print(f"Initialized evaluator with {len(self.validation_ids)} validation samples.")
-        print(f"Available models: {list(self.models.keys())}")
+
+    def _ensure_models_loaded(self) -> Dict[str, Any]:
+        """Imports visual_interpreter and creates the configured models on first call."""
+        if self.models is None:
+            visual_interpreter = importlib.import_module("visual_interpreter")
+            self.models = visual_interpreter.create_models(MODEL_CONFIGS)
+            print(f"Available models: {list(self.models.keys())}")
+        return self.models
 
     def _load_validation_embeddings(self) -> Optional[Dict]:
         """Loads precomputed validation embeddings based on the provider."""
@@ -70,98 +94,201 @@ class ValidationEvaluator:
         emb_path = self.base_path / "notebooks" / "data" / "embeddings" / file_name
         print(f"Loading validation embeddings from: {emb_path}")
         if emb_path.exists():
-            with open(emb_path, "r", encoding="utf-8") as f:
-                return json.load(f)
+            return orjson.loads(emb_path.read_bytes())
         print(f"⚠️ Embeddings file not found at {emb_path}")
         return None
 
+    @staticmethod
+    def _index_embeddings(items: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        """Maps each validation ID to its unit-normalized embedding.
+
+        All vectors are packed into one contiguous (N, D) float32 matrix and normalized
+        in a single pass; the dict values are row views into it.
+        """
+        ids, vectors = [], []
+        for item in items:
+            raw_embedding = item.get("embedding")
+            if not raw_embedding:
+                continue
+            ids.append(str(item["id"]))
+            vectors.append(raw_embedding[0] if isinstance(raw_embedding[0], list) else raw_embedding)
+        if not vectors:
+            return {}
+        
+        return dict(zip(ids, normalize_rows(vectors)))
+
     def _get_similar_images(self, validation_id: str) -> Optional[Dict[str, Any]]:
-        """Gets similar images for a validation ID."""
-        v_item = next((item for item in self.validation_embeddings.get("items", []) if str(item.get("id")) == str(validation_id)), None)
-        if not v_item:
-            return None
+        """Gets similar images for a validation ID (memoized per evaluator)."""
+        validation_id = str(validation_id)
+        cached = self._similar_cache.get(validation_id)
+        if cached is not None:
+            return cached
         
-        raw_embedding = v_item["embedding"]
-        emb_vec = raw_embedding[0] if isinstance(raw_embedding[0], list) else raw_embedding
+        emb_vec = self._emb_by_id.get(validation_id)
+        if emb_vec is None:
+            return None
         
         try:
-            return self.db.search_similar_images(
+            top_k = self.config["top_k_similar"]
+            result = self.db.search_similar_images(
                 emb_vec,
-                n_results=self.config["top_k_similar"],
-                collection_name=self.train_collection_name
+                n_results=top_k,
+                collection_name=self.train_collection_name,
+                ef_search=recommended_ef_search(top_k),
+                normalized=True  # rows were normalized by _index_embeddings
             )
+            # Failed searches (reported via an "error" key) are not cached so they get retried
+            if "error" not in result:
+                self._similar_cache[validation_id] = result
+            return result
         except Exception as e:
             print(f"Similarity search failed for ID {validation_id}: {e}")
             return None
 
     def _build_context_prompt(self, similar_images: Dict[str, Any]) -> str:
         """Builds context prompt from similar images."""
-        prompt = "Your goal is to optimize your first response by generating a brief, but detailed description of the picture and prioritize what the user most likely needs.\n\n"
-        prompt += "We have retrieved pictures with similar visual context. In these pictures, users asked the following questions:"
-        
-        for res in similar_images["similar_images"]:
-            prompt += f"\n - {res['metadata'].get('question', 'No question available')}"
-        
-        prompt += "\n\nUse these questions as a guide for what kind of information is important to users."
-        prompt += "\nIf the past questions conflict with the visual information, ignore them and prioritize describing the image's most prominent features."
-        prompt += "\nHere is the first picture that you must give a description of."
-        return prompt
+        return build_context_prompt(
+            res['metadata'].get('question', 'No question available') for res in similar_images["similar_images"]
+        )
 
     def _evaluate_single_sample(self, validation_id: str, model_name: str, model: Any, with_context: bool) -> Dict[str, Any]:
         """Evaluates a single validation sample."""
-        v_item = next((item for item in self.validation_embeddings.get("items", []) if str(item.get("id")) == str(validation_id)), None)
+        v_item = self._items_by_id.get(str(validation_id))
         if not v_item:
             return {"error": f"Data for ID {validation_id} not found."}
             
         metadata = v_item.get("metadata", {})
         
+        # "timestamp" stays a datetime; orjson writes it as the same ISO 8601 string isoformat() would
         result = {
             "validation_id": validation_id, "model_name": model_name, "with_context": with_context,
             "embedding_provider": self.embedding_provider, "top_k_similar": self.config["top_k_similar"],
             "image_url": metadata.get("image_url", ""), "real_question": metadata.get("question", ""),
-            "crowd_majority": metadata.get("crowd_majority", ""), "timestamp": datetime.now().isoformat(),
+            "crowd_majority": metadata.get("crowd_majority", ""), "timestamp": datetime.now(),
             "similar_images": [], "prompt_used": "", "llm_response": "", "error": None, "processing_time": 0.0
         }
         
         if not result["image_url"]:
             result["error"] = "No image URL found"
             return result
-            
+        
+        if with_context:
+            return self._evaluate_with_context(validation_id, result, model)
+        return self._evaluate_without_context(result, model)
+
+    def _evaluate_without_context(self, result: Dict[str, Any], model: Any) -> Dict[str, Any]:
+        """Runs the model with the fixed no-context prompt; no similarity search involved."""
+        return self._run_model(result, model, NO_CONTEXT_PROMPT, time.time())
+
+    def _evaluate_with_context(self, validation_id: str, result: Dict[str, Any], model: Any) -> Dict[str, Any]:
+        """Retrieves similar images, builds the context prompt and runs the model.
+
+        If retrieval fails or finds nothing, the row is marked with an error
+        instead of silently running the no-context prompt, so it is never
+        mistaken for a with-context result (and --resume retries it).
+        """
         start_time = time.time()
         
+        similar_images_result = self._get_similar_images(validation_id)
+        if not similar_images_result or similar_images_result.get("error") or not similar_images_result["similar_images"]:
+            reason = (similar_images_result or {}).get("error") or "no similar images found"
+            result["error"] = f"Retrieval failed: {reason}"
+            result["processing_time"] = time.time() - start_time
+            return result
+        
+        saved_similar_images = []
+        for res in similar_images_result["similar_images"]:
+            sim_meta = res.get("metadata", {})
+            saved_similar_images.append({
+                "id": res.get("id"),
+                "distance": res.get("distance"),
+                "question": sim_meta.get("question", ""),
+                "image_url": sim_meta.get("image_url", ""),
+                "crowd_majority": sim_meta.get("crowd_majority", "")
+            })
+        result["similar_images"] = saved_similar_images
+        prompt = self._build_context_prompt(similar_images_result)
+        
+        return self._run_model(result, model, prompt, start_time)
+
+    def _run_model(self, result: Dict[str, Any], model: Any, prompt: str, start_time: float) -> Dict[str, Any]:
+        """Sends the prompt and image to the model and records the response on `result`."""
         try:
-            prompt = "Your goal is to optimize your first response by generating a brief, but detailed description of the picture and prioritize what the user most likely needs.\nHere is the first picture that you must give a description of."
-            
-            if with_context:
-                
-                similar_images_result = self._get_similar_images(validation_id)
-                if similar_images_result and similar_images_result["similar_images"]:
-                    saved_similar_images = []
-                    for res in similar_images_result["similar_images"]:
-                        sim_meta = res.get("metadata", {})
-                        saved_similar_images.append({
-                            "id": res.get("id"),
-                            "distance": res.get("distance"),
-                            "question": sim_meta.get("question", ""),
-                            "image_url": sim_meta.get("image_url", ""),
-                            "crowd_majority": sim_meta.get("crowd_majority", "")
-                        })
-                    result["similar_images"] = saved_similar_images
-                    
-                    prompt = self._build_context_prompt(similar_images_result)
-            
             result["prompt_used"] = prompt
-            response, *_ = model.generate(prompt, mode="standard", image_urls=[result["image_url"]], system_prompt=SYSTEM_PROMPT)
+            response, *_ = model.generate(prompt, mode="standard", image_urls=[result["image_url"]], system_prompt=get_system_prompt())
             result["llm_response"] = response
-            
         except Exception as e:
             result["error"] = str(e)
         
         result["processing_time"] = time.time() - start_time
         return result
 
-    def run_evaluation(self, output_filename: Optional[str] = None) -> str:
-        """Runs the full evaluation."""
+    def _context_modes(self) -> Tuple[bool, ...]:
+        """The with_context values to evaluate, in the order they are submitted."""
+        return tuple(mode for mode, enabled in ((True, self.config["with_context"]), (False, self.config["without_context"])) if enabled)
+
+    @staticmethod
+    def _load_completed_tasks(output_path: Path) -> Set[Tuple[str, str, bool]]:
+        """Keeps only successful rows of a previous run's JSONL and returns their task keys.
+
+        Failed rows (an `error`, or an empty / "[ERROR]" / "Error:" `llm_response`
+        as reported in-band by the model wrappers) and a line truncated by a crash
+        are dropped from the file, so their tasks are rerun and each task ends up
+        with exactly one row.
+        """
+        done: Set[Tuple[str, str, bool]] = set()
+        kept: List[bytes] = []
+        with open(output_path, "rb") as f:
+            for line in f:
+                try:
+                    row = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    continue
+                if row.get("error") is None and "model_name" in row and not _is_failed_response(row.get("llm_response")):
+                    done.add((str(row["validation_id"]), row["model_name"], row["with_context"]))
+                    kept.append(line if line.endswith(b"\n") else line + b"\n")
+        
+        tmp_path = output_path.with_suffix(output_path.suffix + ".tmp")
+        tmp_path.write_bytes(b"".join(kept))
+        tmp_path.replace(output_path)
+        return done
+
+    def _run_tasks(self, validation_samples: List[str], f, pbar, done: Set[Tuple[str, str, bool]] = frozenset()) -> None:
+        """Keeps up to `max_workers` requests in flight and writes each result as it lands.
+
+        Tasks whose (validation_id, model_name, with_context) key is in `done` are skipped.
+        """
+        modes = self._context_modes()
+        model_items = tuple(self.models.items())
+        evaluate = self._evaluate_single_sample
+        
+        with ThreadPoolExecutor(max_workers=self.config["max_workers"]) as executor:
+            futures = []
+            for validation_id in validation_samples:
+                for model_name, model in model_items:
+                    for with_context in modes:
+                        if (validation_id, model_name, with_context) in done:
+                            pbar.update(1)
+                            continue
+                        futures.append(executor.submit(evaluate, validation_id, model_name, model, with_context))
+            
+            try:
+                for written, future in enumerate(as_completed(futures), start=1):
+                    f.write(orjson.dumps(future.result(), option=orjson.OPT_APPEND_NEWLINE))
+                    if written % RESULTS_FLUSH_EVERY == 0:
+                        f.flush()
+                    pbar.update(1)
+            except BaseException:
+                # Drop queued (paid) model calls on Ctrl-C or error; --resume picks them up later
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    def run_evaluation(self, output_filename: Optional[str] = None, resume: bool = False) -> str:
+        """Runs the full evaluation.
+
+        With `resume=True` and an existing `output_filename`, tasks that already
+        have a successful row are skipped and new rows are appended.
+        """
         if output_filename is None:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             provider = self.embedding_provider
@@ -173,34 +300,72 @@ class ValidationEvaluator:
         if self.config["max_validation_samples"]:
             validation_samples = validation_samples[:self.config["max_validation_samples"]]
         
+        # Samples without an image URL can never be evaluated; drop them before any work is scheduled
+        usable_samples = [
+            vid for vid in validation_samples
+            if self._items_by_id[vid].get("metadata", {}).get("image_url")
+        ]
+        if len(usable_samples) < len(validation_samples):
+            print(f"Skipping {len(validation_samples) - len(usable_samples)} validation samples with no image URL.")
+        validation_samples = usable_samples
+        
+        self._ensure_models_loaded()
+        
         print(f"Starting evaluation of {len(validation_samples)} validation samples...")
         print(f"Results will be saved to: {output_path}")
         
-        total_iterations = len(validation_samples) * len(self.models)
-        if self.config["with_context"] and self.config["without_context"]:
-            total_iterations *= 2
+        total_iterations = len(validation_samples) * len(self.models) * len(self._context_modes())
         
-        with open(output_path, "w", encoding="utf-8") as f, tqdm(total=total_iterations, desc="Evaluating") as pbar:
-            for validation_id in validation_samples:
-                for model_name, model in self.models.items():
-                    if self.config["with_context"]:
-                        f.write(json.dumps(self._evaluate_single_sample(validation_id, model_name, model, True)) + "\n")
-                        pbar.update(1)
-                    
-                    if self.config["without_context"]:
-                        f.write(json.dumps(self._evaluate_single_sample(validation_id, model_name, model, False)) + "\n")
-                        pbar.update(1)
+        done: Set[Tuple[str, str, bool]] = set()
+        if resume and output_path.exists():
+            done = self._load_completed_tasks(output_path)
+            print(f"Resuming: {len(done)} completed results found in {output_path.name}")
+        
+        mode = "ab" if done else "wb"
+        with open(output_path, mode, buffering=RESULTS_WRITE_BUFFER) as f, tqdm(total=total_iterations, desc="Evaluating") as pbar:
+            self._run_tasks(validation_samples, f, pbar, done)
         
         print(f"Evaluation completed. Results saved to: {output_path}")
         return str(output_path)
 
 def main():
     """Main function to run the evaluation."""
+    parser = argparse.ArgumentParser(description="Run the VisionRAG validation dataset evaluation.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=EVALUATION_CONFIG["max_workers"],
+        help="Number of model requests kept in flight at once (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--output",
+        help="Results file name inside notebooks/data/results (default: timestamped name)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip tasks that already have a successful row in --output and append the rest",
+    )
+    parser.add_argument(
+        "--llm-cache",
+        nargs="?",
+        const="",
+        metavar="DIR",
+        help="Replay identical model requests from an on-disk cache (default dir: ~/.cache/vlm-rag/llm)",
+    )
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.resume and not args.output:
+        parser.error("--resume requires --output")
+    
     print("Starting VisionRAG Validation Dataset Evaluation")
     print("=" * 50)
     
-    evaluator = ValidationEvaluator(config=EVALUATION_CONFIG)
-    jsonl_path = evaluator.run_evaluation()
+    evaluator = ValidationEvaluator(config={**EVALUATION_CONFIG, "max_workers": args.workers})
+    if args.llm_cache is not None:
+        importlib.import_module("visual_interpreter").BaseModel.enable_cache(args.llm_cache or None)
+    jsonl_path = evaluator.run_evaluation(output_filename=args.output, resume=args.resume)
     
     print("\n" + "=" * 50)
     print("Evaluation completed successfully!")
@@ -0,0 +1,57 @@
+import os
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+import orjson
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "vlm-rag" / "llm"
+
+def _json_default(obj: Any) -> Any:
+    """Serialize SDK message parts (e.g. Gemini `Part`) for hashing"""
+    if hasattr(obj, "model_dump"):
+        # mode="json" turns inline image bytes into base64 so they are part of the key
+        return obj.model_dump(mode="json", exclude_none=True)
+    if isinstance(obj, (bytes, bytearray)):
+        return hashlib.sha256(obj).hexdigest()
+    return str(obj)
+
+class LLMCache:
+    """Exact-match response cache for deterministic (temperature 0) model calls
+
+    Each response is one small JSON file named by the SHA-256 of the request,
+    written atomically, so concurrent worker threads and re-runs can share it.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path] = DEFAULT_CACHE_DIR):
+        self.cache_dir = Path(cache_dir).expanduser()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(model: str, messages: List[Any], system_prompt: Optional[str], mode: str) -> str:
+        """SHA-256 over everything that determines the response (images are inlined in `messages`)"""
+        payload = orjson.dumps(
+            {"model": model, "messages": messages, "system": system_prompt, "mode": mode},
+            default=_json_default,
+            option=orjson.OPT_SORT_KEYS,
+        )
+        return hashlib.sha256(payload).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached entry for `key`, or None on a miss"""
+        try:
+            return orjson.loads(self._path(key).read_bytes())
+        except (FileNotFoundError, orjson.JSONDecodeError):
+            return None
+
+    def set(self, key: str, text: str) -> None:
+        """Store a response text; readers never see a partially written file"""
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(orjson.dumps({"text": text}))
+        os.replace(tmp, path)
@@ -16,18 +16,15 @@ def main():
     
     try:
         # Initialize evaluator
-        evaluator = ValidationEvaluator()
+        evaluator = ValidationEvaluator(config=EVALUATION_CONFIG)
         
         # Run evaluation
         jsonl_path = evaluator.run_evaluation("test_evaluation_results.jsonl")
         
-        # Generate HTML report
-        html_path = evaluator.generate_html_report(jsonl_path, "test_evaluation_report.html")
-        
         print("\n" + "=" * 50)
         print("Test evaluation completed successfully!")
         print(f"Results saved to: {jsonl_path}")
-        print(f"HTML report: {html_path}")
+        print("Upload the JSONL file to the dashboard in data-visualization-VLM/ to inspect it.")
         
     finally:
         # Restore original config
@@ -1,52 +1,169 @@
-from vector_db import SimpleVectorDB  # type: ignore
+from vector_db import SimpleVectorDB, load_embedding_matrix, recommended_ef_search  # type: ignore
+from utils import get_system_prompt, build_context_prompt, NO_CONTEXT_PROMPT  # type: ignore
 import os
 import sys
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-import yaml
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Tuple
 import random
 import base64
-import requests
-import cohere  # type: ignore
-import json
+import mimetypes
+import hashlib
+import functools
+from dataclasses import dataclass
+import numpy as np
+import orjson
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 load_dotenv()
-# Load prompt from YAML file in configs
-_prompts_path = Path(__file__).resolve().parents[1] / "configs" / "prompts.yml"
-with open(_prompts_path, "r", encoding="utf-8") as _f:
-    _prompts = yaml.safe_load(_f)
 
-# Type-annotated constants
-SYSTEM_PROMPT: str = _prompts["be_my_ai_prompt"]
+if TYPE_CHECKING:
+    # Only for annotations; both are imported lazily where they are used
+    import cohere  # type: ignore
+    import requests
 
 # Flip for testing
 with_context = True
 fixed_validation = False
 
-def cohere_generate_image_embedding(image_path: str) -> List[float]:
-    """Generate float embedding for an image via Cohere embed-v4.0."""
-    co = cohere.ClientV2(api_key=os.getenv("COHERE_API_KEY"))
+COHERE_MAX_IMAGES_PER_CALL = 96
+COHERE_EMBED_MODEL = "embed-v4.0"
+
+# Embeddings already computed for an image are stored here, keyed by model + content hash
+EMBEDDING_CACHE_DIR = Path(__file__).resolve().parents[1] / "notebooks" / "data" / "embeddings" / ".cohere_cache"
+
+
+@functools.lru_cache(maxsize=1)
+def _http_session() -> "requests.Session":
+    """Shared session so image downloads reuse pooled keep-alive connections."""
+    # Imported lazily: only the embedding helpers need an HTTP stack
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=32,
+        max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504]),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # Some image CDNs throttle or reject the default python-requests agent
+    session.headers["User-Agent"] = "VLM-RAG/1.0 (image embedding)"
+    return session
+
+
+@functools.lru_cache(maxsize=1)
+def _cohere_client() -> "cohere.ClientV2":
+    """Single Cohere client (and underlying HTTP pool) reused across embed calls."""
+    import cohere  # type: ignore
 
+    return cohere.ClientV2(api_key=os.getenv("COHERE_API_KEY"))
+
+
+def _load_image(image_path: str) -> Tuple[bytes, str]:
+    """Read a local file or fetch a URL and return its bytes and mime type."""
     if image_path.startswith(("http://", "https://")):
-        resp = requests.get(image_path, timeout=10)
+        resp = _http_session().get(image_path, timeout=10)
         resp.raise_for_status()
-        img_bytes = resp.content
-        mime = resp.headers.get("Content-Type", "image/jpeg")
-    else:
-        with open(image_path, "rb") as f:
-            img_bytes = f.read()
-        mime = "image/jpeg"
+        mime = resp.headers.get("Content-Type", "image/jpeg").split(";", 1)[0].strip()
+        return resp.content, mime
 
-    data_uri = f"data:{mime};base64,{base64.b64encode(img_bytes).decode()}"
+    mime, _ = mimetypes.guess_type(image_path)
+    return Path(image_path).read_bytes(), mime or "image/jpeg"
 
-    resp = co.embed(
-        model="embed-v4.0",
-        input_type="image",
-        embedding_types=["float"],
-        images=[data_uri],
-    )
 
-    return resp.embeddings.float
+def _to_data_uri(img_bytes: bytes, mime: str) -> str:
+    # Join the ASCII pieces as bytes and decode once, instead of decoding the
+    # base64 payload to str and then copying it again into an f-string.
+    return b"".join((b"data:", mime.encode("ascii"), b";base64,", base64.b64encode(img_bytes))).decode("ascii")
+
+
+def _embedding_cache_key(img_bytes: bytes) -> str:
+    # Prefix with the model so switching models never serves stale vectors
+    return f"{COHERE_EMBED_MODEL}_{hashlib.sha256(img_bytes).hexdigest()}"
+
+
+@functools.lru_cache(maxsize=2048)
+def _load_cached_embedding(cache_key: str) -> Tuple[float, ...]:
+    """Read a cached embedding from disk. Raises FileNotFoundError on a miss (misses are not memoized)."""
+    return tuple(np.load(EMBEDDING_CACHE_DIR / f"{cache_key}.npy").tolist())
+
+
+def _store_cached_embedding(cache_key: str, embedding: List[float]) -> None:
+    EMBEDDING_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    np.save(EMBEDDING_CACHE_DIR / f"{cache_key}.npy", np.asarray(embedding, dtype=np.float32))
+
+
+# Image source -> embedding cache key, so repeat calls for the same image skip re-reading/re-downloading it
+_SOURCE_CACHE_KEYS: Dict[Tuple[str, Optional[int]], str] = {}
+
+
+def _source_token(image_path: str) -> Tuple[str, Optional[int]]:
+    # Local files are keyed by mtime so edits invalidate the entry; URLs are assumed immutable
+    if image_path.startswith(("http://", "https://")):
+        return image_path, None
+    return image_path, os.stat(image_path).st_mtime_ns
+
+
+def _embedding_for_source(token: Tuple[str, Optional[int]]) -> Optional[List[float]]:
+    """Return the cached embedding for an already-seen image source, or None."""
+    cache_key = _SOURCE_CACHE_KEYS.get(token)
+    if cache_key is None:
+        return None
+    try:
+        return list(_load_cached_embedding(cache_key))
+    except FileNotFoundError:
+        return None
+
+
+def cohere_generate_image_embedding(image_path: str) -> List[List[float]]:
+    """Generate float embedding for an image via Cohere embed-v4.0."""
+    return cohere_generate_image_embeddings_batch([image_path])
+
+
+def cohere_generate_image_embeddings_batch(
+    image_paths: List[str], batch_size: int = COHERE_MAX_IMAGES_PER_CALL
+) -> List[List[float]]:
+    """Generate float embeddings for many images, one Cohere call per batch of cache misses."""
+    batch_size = min(batch_size, COHERE_MAX_IMAGES_PER_CALL)
+
+    tokens = [_source_token(path) for path in image_paths]
+    embeddings: List[Optional[List[float]]] = [_embedding_for_source(token) for token in tokens]
+    unseen = [i for i, embedding in enumerate(embeddings) if embedding is None]
+
+    # Image loading is I/O bound, so fetch several of them concurrently
+    if len(unseen) > 1:
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            loaded = list(pool.map(_load_image, [image_paths[i] for i in unseen]))
+    else:
+        loaded = [_load_image(image_paths[i]) for i in unseen]
+
+    images: Dict[int, Tuple[bytes, str]] = dict(zip(unseen, loaded))
+    cache_keys: Dict[int, str] = {}
+    missing: List[int] = []
+    for i, (img_bytes, _) in images.items():
+        cache_keys[i] = _SOURCE_CACHE_KEYS[tokens[i]] = _embedding_cache_key(img_bytes)
+        try:
+            embeddings[i] = list(_load_cached_embedding(cache_keys[i]))
+        except FileNotFoundError:
+            missing.append(i)
+
+    if missing:
+        co = _cohere_client()
+        for start in range(0, len(missing), batch_size):
+            chunk = missing[start:start + batch_size]
+            resp = co.embed(
+                model=COHERE_EMBED_MODEL,
+                input_type="image",
+                embedding_types=["float"],
+                images=[_to_data_uri(*images[i]) for i in chunk],
+            )
+            for i, embedding in zip(chunk, resp.embeddings.float):
+                _store_cached_embedding(cache_keys[i], embedding)
+                embeddings[i] = embedding
+
+    return embeddings
 
 
 # Edit these model identifiers to match what is available to your API key / account.
@@ -62,22 +179,13 @@ MODEL_CONFIGS: List[Dict[str, str]] = [
 sys.path.append(os.path.dirname(__file__)) 
 
 # ------------------------------------------------------------
-# Vector database setup (mirrors notebook logic)
+# Paths and dataset constants
 # ------------------------------------------------------------
-# Allow static analyzers to resolve; this module is in same directory
-
 
-# Initialize vector DB (will open existing persisted chroma_db)
+# Persisted chroma_db built by the notebooks
 CHROMA_PATH = Path(__file__).resolve().parents[1] / "notebooks" / "data" / "chroma_db"
-db: SimpleVectorDB = SimpleVectorDB(db_path=str(CHROMA_PATH))
-db.use_collection("vizwiz_500_sample_cosine", "500 random VizWiz samples") 
-# Print database stats to validate collection
-print(f"Database stats: {db.get_collection_stats()}")
-
-# ------------------------------------------------------------
-# Load original VizWiz JSON so it is ready for later steps
-# ------------------------------------------------------------
 
+# Original VizWiz JSON, used to look up the chosen validation image
 ALL_JSON_PATH = (
     Path(__file__).resolve().parents[1]
     / "notebooks"
@@ -86,134 +194,173 @@ ALL_JSON_PATH = (
     / "all.json"
 )
 
-ALL_DATA: Dict[str, Any] = {}
-
-try:
-    with open(ALL_JSON_PATH, "r", encoding="utf-8") as _f:
-        ALL_DATA = json.load(_f)
-    print(f"Loaded original VizWiz data: {len(ALL_DATA)} entries")
-except FileNotFoundError:
-    print(f"⚠️ all.json not found at {ALL_JSON_PATH}")
-
-# ------------------------------------------------------------
-# Pull existing items and create sample / validation subsets
-# ------------------------------------------------------------
-
-collection_snapshot = db.current_collection.get()
-ALL_IDS: List[str] = collection_snapshot["ids"]
-
-print(f"Total items in collection: {len(ALL_IDS)}")
-
-# Inspection make sure that everything is working
-SAMPLE_PREVIEW: List[str] = ALL_IDS[:2]
-print("First 10 IDs:", SAMPLE_PREVIEW)
-
-# Validation set: the 100 IDs in [1..600] that are NOT in the collection
-existing_ids_int = {int(x) for x in ALL_IDS if str(x).isdigit()}
-VALIDATION_IDS: List[str] = [str(i) for i in range(1, 601) if i not in existing_ids_int]
-validation_id = -1
-print(f"Validation sample size (missing IDs): {len(VALIDATION_IDS)}")
-
-if fixed_validation:
-    validation_id = VALIDATION_IDS[0]
-else:
-    validation_id = random.choice(VALIDATION_IDS)
+# Only these fields of all.json are ever read
+ORIGINAL_FIELDS: Tuple[str, ...] = ("image_url", "question", "crowd_majority")
 
-# Retrieve the image URL for the chosen validation ID
-VALIDATION_IMAGE_URL: str = ""
-VALIDATION_IMAGE_REAL_QUESTION: str = ""
-if validation_id in ALL_DATA:
-    VALIDATION_IMAGE_URL = ALL_DATA[validation_id].get("image_url", "")
-    VALIDATION_IMAGE_REAL_QUESTION = ALL_DATA[validation_id].get("question", "")
-
-# Fallback constant used later for model call
-IMAGE_URL: str = VALIDATION_IMAGE_URL 
-
-# ------------------------------------------------------------
-# Load pre-computed embeddings file (if present)
-# ------------------------------------------------------------
+# Validation set: the IDs in [1..TOTAL_IDS] that are NOT in the collection
+TOTAL_IDS = 600
 
 EMB_PATHS: List[str] = [
     str(Path(__file__).resolve().parents[1] / "notebooks" / "data" / "embeddings" / "lf_vqa_validation_embeddings_cohere.json"),
     str(Path(__file__).resolve().parents[1] / "notebooks" / "data" / "embeddings" / "lf_vqa_db_embeddings_cohere.json"),
 ]
 
-validation_embeddings: Optional[Dict] = None
-for p in EMB_PATHS:
-    if Path(p).exists():
-        with open(p, "r", encoding="utf-8") as _f:
-            validation_embeddings = yaml.safe_load(_f)  # using yaml to preserve order/float
-        break
 
-# ------------------------------------------------------------
-PROMPT: str = "Your goal is to optimize your first response by generating a brief, but detailed description of the picture and prioritize what the user most likely needs.\nHere is the first picture that you must give a description of."
-
-if with_context:
-    # --- Similarity search using precomputed embedding for validation_id ---
-    if validation_embeddings:
-        v_item = None
-        for itm in validation_embeddings.get("items", []):
-            if str(itm.get("id")) == str(validation_id):
-                v_item = itm
-                break
-
-        if v_item:
-            emb_vec = v_item["embedding"][0] if isinstance(v_item["embedding"], list) else v_item["embedding"]
-            try:
-                sim_results = db.search_similar_images(emb_vec, n_results=3)
-                print("Top 3 similar images:")
-                for res in sim_results["similar_images"]:
-                    print(f"  ID {res['id']} distance {res['distance']:.3f}")
-                # Extract and display metadata from similar images
-                print("\nSimilar Image Questions:")
-
-                PROMPT = "Your goal is to optimize your first response by generating a brief, but detailed description of the picture and prioritize what the user most likely needs.\n\n"
-                PROMPT += "We have retrieved pictures with similar visual context. In these pictures, users asked the following questions:"
-                
-                for idx, res in enumerate(sim_results["similar_images"]):
-                    metadata = res["metadata"]
-                    question = metadata.get("question", "No question available")
-                    image_url = metadata.get("image_url", "No URL available")
-                    crowd_majority = metadata.get("crowd_majority", "No answer available")
-                    
-                    print(f"  {idx+1}. Image ID: {res['id']}")
-                    print(f"     Question: {question}")
-                    PROMPT += f"\n - {question}"
-                    print(f"     Image URL: {image_url}")
-                    print(f"     Crowd Answer: {crowd_majority}")
-                    print(f"     Distance: {res['distance']:.3f}")
-                    print()
-                
-                PROMPT += "\n\nUse these questions as a guide for what kind of information is important to users."
-                PROMPT += "\nIf the past questions conflict with the visual information, ignore them and prioritize describing the image's most prominent features."
-                PROMPT += "\nHere is the first picture that you must give a description of."
-                
-            except Exception as e:
-                print(f"Similarity search failed: {e}")
-        else:
-            print(f"Embedding for validation ID {validation_id} not found in precomputed file.")
+@dataclass(frozen=True)
+class QueryContext:
+    """Everything main() needs for one query, prepared by _bootstrap()."""
+    db: SimpleVectorDB
+    validation_id: str
+    image_url: str
+    real_question: str
+    prompt: str
+
+
+@functools.lru_cache(maxsize=1)
+def _original_index() -> Dict[str, Dict[str, Any]]:
+    """Compact id -> {image_url, question, crowd_majority} view of all.json, loaded on first use."""
+    try:
+        data = orjson.loads(ALL_JSON_PATH.read_bytes())
+    except FileNotFoundError:
+        print(f"⚠️ all.json not found at {ALL_JSON_PATH}")
+        return {}
+    index = {k: {field: v.get(field, "") for field in ORIGINAL_FIELDS} for k, v in data.items()}
+    print(f"Loaded original VizWiz data: {len(index)} entries")
+    return index
+
+
+def _open_db() -> SimpleVectorDB:
+    """Open the persisted collection (mirrors notebook logic) and start warming it."""
+    db = SimpleVectorDB(db_path=str(CHROMA_PATH))
+    db.use_collection("vizwiz_500_sample_cosine", "500 random VizWiz samples")
+    db.warm_up()
+    # Print database stats to validate collection
+    print(f"Database stats: {db.get_collection_stats()}")
+    return db
+
+
+def _validation_ids(db: SimpleVectorDB) -> List[str]:
+    """IDs in [1..TOTAL_IDS] that are not in the collection, ascending."""
+    # Only the IDs are needed; include=[] skips transferring metadata and documents
+    all_ids: List[str] = db.current_collection.get(include=[])["ids"]
+    print(f"Total items in collection: {len(all_ids)}")
+
+    # Inspection make sure that everything is working
+    print("First 10 IDs:", all_ids[:2])
+
+    # Collection IDs are integer strings; a non-numeric ID is a data error, so let int() raise
+    existing_ids = np.fromiter(map(int, all_ids), dtype=np.int64, count=len(all_ids))
+    missing_mask = np.ones(TOTAL_IDS, dtype=bool)
+    missing_mask[existing_ids[(existing_ids >= 1) & (existing_ids <= TOTAL_IDS)] - 1] = False
+    validation_ids = (np.flatnonzero(missing_mask) + 1).astype(str).tolist()
+    print(f"Validation sample size (missing IDs): {len(validation_ids)}")
+    return validation_ids
+
+
+def _load_query_embeddings() -> Tuple[Optional[np.ndarray], Dict[str, int]]:
+    """(N, D) float32 matrix, memory-mapped from a .npy sidecar, plus validation ID -> row index."""
+    for p in EMB_PATHS:
+        if Path(p).exists():
+            return load_embedding_matrix(p)
+    return None, {}
+
+
+def _build_context_prompt(db: SimpleVectorDB, validation_id: str) -> str:
+    """Retrieve the top-3 similar images and build the context prompt; falls back to NO_CONTEXT_PROMPT."""
+    validation_embeddings, emb_rows = _load_query_embeddings()
+    if validation_embeddings is None:
+        return NO_CONTEXT_PROMPT
+
+    emb_row = emb_rows.get(str(validation_id))
+    if emb_row is None:
+        print(f"Embedding for validation ID {validation_id} not found in precomputed file.")
+        return NO_CONTEXT_PROMPT
+
+    emb_vec = validation_embeddings[emb_row]
+    try:
+        sim_results = db.search_similar_images(emb_vec, n_results=3, ef_search=recommended_ef_search(3))
+        print("Top 3 similar images:")
+        for res in sim_results["similar_images"]:
+            print(f"  ID {res['id']} distance {res['distance']:.3f}")
+        # Extract and display metadata from similar images
+        print("\nSimilar Image Questions:")
+
+        questions = []
+        for idx, res in enumerate(sim_results["similar_images"]):
+            metadata = res["metadata"]
+            question = metadata.get("question", "No question available")
+            image_url = metadata.get("image_url", "No URL available")
+            crowd_majority = metadata.get("crowd_majority", "No answer available")
+            
+            print(f"  {idx+1}. Image ID: {res['id']}")
+            print(f"     Question: {question}")
+            questions.append(question)
+            print(f"     Image URL: {image_url}")
+            print(f"     Crowd Answer: {crowd_majority}")
+            print(f"     Distance: {res['distance']:.3f}")
+            print()
+        
+        return build_context_prompt(questions)
+        
+    except Exception as e:
+        print(f"Similarity search failed: {e}")
+        return NO_CONTEXT_PROMPT
+
+
+@functools.lru_cache(maxsize=1)
+def _bootstrap() -> QueryContext:
+    """Open the DB, pick a validation image and build its prompt (once per process, not at import)."""
+    db = _open_db()
+    validation_ids = _validation_ids(db)
+
+    if fixed_validation:
+        validation_id = validation_ids[0]
+    else:
+        validation_id = random.choice(validation_ids)
+
+    # Retrieve the image URL for the chosen validation ID
+    original = _original_index().get(validation_id) or {}
+
+    prompt = _build_context_prompt(db, validation_id) if with_context else NO_CONTEXT_PROMPT
+
+    return QueryContext(
+        db=db,
+        validation_id=validation_id,
+        image_url=original.get("image_url", ""),
+        real_question=original.get("question", ""),
+        prompt=prompt,
+    )
 
-    
 
 def main() -> None:
+    ctx = _bootstrap()
+
     import importlib
     visual_interpreter = importlib.import_module("visual_interpreter")
     models: Dict[str, Any] = visual_interpreter.create_models(MODEL_CONFIGS) 
 
-    for name, model in models.items():
-        print(f"\n=== {name} ===")
-        try:
-            print(PROMPT)
-            print("--------------------------------")
-            text, *_ = model.generate(PROMPT, mode="standard", image_urls=[IMAGE_URL], system_prompt=SYSTEM_PROMPT)  # type: ignore
-            print(text)
-            print("--------------------------------")
-            print(f"Real question: {VALIDATION_IMAGE_REAL_QUESTION}")
-            print("--------------------------------")
-            print(f"Original Image: {IMAGE_URL}")
-            print("--------------------------------")
-        except Exception as e:
-            print(f"Error for {name}: {e}")
+    print(ctx.prompt)
+    print("--------------------------------")
+
+    # Providers are independent HTTP endpoints, so query them all at once
+    with ThreadPoolExecutor(max_workers=max(1, len(models))) as pool:
+        futures = {
+            pool.submit(model.generate, ctx.prompt, mode="standard", image_urls=[ctx.image_url], system_prompt=get_system_prompt()): name  # type: ignore
+            for name, model in models.items()
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            print(f"\n=== {name} ===")
+            try:
+                text, *_ = future.result()
+                print(text)
+                print("--------------------------------")
+                print(f"Real question: {ctx.real_question}")
+                print("--------------------------------")
+                print(f"Original Image: {ctx.image_url}")
+                print("--------------------------------")
+            except Exception as e:
+                print(f"Error for {name}: {e}")
 
 
 if __name__ == "__main__":
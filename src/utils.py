@@ -1,8 +1,59 @@
 import os
+import functools
+from pathlib import Path
 import json
-from typing import Dict, Any, List
+import orjson
+import yaml
+from typing import Dict, Any, Iterable, List, Optional
 from datetime import datetime
 
+# libyaml-backed loader when PyYAML was built with it; pure-Python otherwise
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+def load_yaml(path) -> Any:
+    """Safe-load a YAML file, using the C parser when available"""
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.load(f, Loader=_YamlLoader)
+
+PROMPTS_PATH = Path(__file__).resolve().parents[1] / "configs" / "prompts.yml"
+
+@functools.lru_cache(maxsize=1)
+def load_prompts() -> Dict[str, str]:
+    """Prompts from configs/prompts.yml, parsed once per process on first use"""
+    return load_yaml(PROMPTS_PATH)
+
+def get_system_prompt() -> str:
+    """System prompt sent with every model call"""
+    return load_prompts()["be_my_ai_prompt"]
+
+# User prompt for the baseline (no retrieved context) condition
+NO_CONTEXT_PROMPT: str = "Your goal is to optimize your first response by generating a brief, but detailed description of the picture and prioritize what the user most likely needs.\nHere is the first picture that you must give a description of."
+
+# Context prompt = header, one " - <question>" line per similar image, footer (joined with newlines)
+CONTEXT_PROMPT_HEADER: str = (
+    "Your goal is to optimize your first response by generating a brief, but detailed description of the picture and prioritize what the user most likely needs.\n\n"
+    "We have retrieved pictures with similar visual context. In these pictures, users asked the following questions:"
+)
+CONTEXT_PROMPT_FOOTER: str = (
+    "\nUse these questions as a guide for what kind of information is important to users.\n"
+    "If the past questions conflict with the visual information, ignore them and prioritize describing the image's most prominent features.\n"
+    "Here is the first picture that you must give a description of."
+)
+
+def build_context_prompt(questions: Iterable[str]) -> str:
+    """User prompt listing the questions asked about similar images"""
+    return "\n".join([CONTEXT_PROMPT_HEADER, *(f" - {q}" for q in questions), CONTEXT_PROMPT_FOOTER])
+
+# Prefixes the model wrappers use to report a failed call in-band as the response text
+FAILED_RESPONSE_PREFIXES = ("[ERROR]", "Error:")
+
+def _is_failed_response(text: Optional[str]) -> bool:
+    """True for an empty model response or one reporting a failure in-band"""
+    return not text or text.startswith(FAILED_RESPONSE_PREFIXES)
+
 def ensure_directory_exists(path: str):
     """Create directory if it doesn't exist"""
     os.makedirs(path, exist_ok=True)
@@ -16,8 +67,13 @@ def save_results_to_json(results: Dict[str, Any], filename: str):
     # Add timestamp to results
     results["timestamp"] = datetime.now().isoformat()
     
-    with open(filepath, 'w') as f:
-        json.dump(results, f, indent=2)
+    # OPT_NON_STR_KEYS coerces int/float/etc. keys to strings like json.dump did.
+    # NaN/Infinity are written as null (valid JSON) rather than json's bare NaN.
+    with open(filepath, 'wb') as f:
+        f.write(orjson.dumps(
+            results,
+            option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        ))
     
     print(f"Results saved to {filepath}")
 
@@ -28,8 +84,13 @@ def load_results_from_json(filename: str) -> Dict[str, Any]:
     if not os.path.exists(filepath):
         raise FileNotFoundError(f"Results file not found: {filepath}")
     
-    with open(filepath, 'r') as f:
-        return json.load(f)
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        # Files written by the old json.dump path may contain bare NaN/Infinity
+        return json.loads(data)
 
 def print_evaluation_summary(results: Dict[str, Any]):
     """Print a nice summary of evaluation results"""
@@ -80,11 +141,13 @@ def list_images_in_directory(directory: str) -> List[str]:
     if not os.path.exists(directory):
         return []
     
-    images = []
-    for filename in os.listdir(directory):
-        filepath = os.path.join(directory, filename)
-        if is_valid_image_file(filepath):
-            images.append(filepath)
+    # scandir yields entry types from the directory listing itself, so no extra stat per file
+    extensions = frozenset(get_supported_image_extensions())
+    with os.scandir(directory) as entries:
+        images = [
+            entry.path for entry in entries
+            if os.path.splitext(entry.name)[1].lower() in extensions and entry.is_file()
+        ]
     
     return sorted(images)
 
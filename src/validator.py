@@ -1,5 +1,7 @@
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
 import os
 from dotenv import load_dotenv
 from typing import Dict, Tuple, Any
@@ -7,6 +9,13 @@ import re
 
 load_dotenv()
 
+# Field patterns for the judge's structured reply, compiled once
+_BASELINE_SCORE_RE = re.compile(r'BASELINE_SCORE:\s*(\d+)')
+_RAG_SCORE_RE = re.compile(r'RAG_SCORE:\s*(\d+)')
+_BASELINE_REASONING_RE = re.compile(r'BASELINE_REASONING:\s*(.+?)(?=RAG_REASONING|WINNER|$)', re.DOTALL)
+_RAG_REASONING_RE = re.compile(r'RAG_REASONING:\s*(.+?)(?=WINNER|$)', re.DOTALL)
+_WINNER_RE = re.compile(r'WINNER:\s*(\w+)')
+
 class ValidationJudge:
     def __init__(self, model: str = "anthropic/claude-3-haiku"):
         """
@@ -25,6 +34,16 @@ class ValidationJudge:
         
         if not self.api_key:
             raise ValueError("OPENROUTER_API_KEY not found in environment variables")
+        
+        # One pooled session so repeated judge calls reuse the TLS connection
+        self.session = requests.Session()
+        self.session.headers.update(self.get_headers())
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["POST"]),
+        )
+        self.session.mount("https://", adapter)
     
     def get_headers(self):
         """Get headers for OpenRouter API"""
@@ -88,14 +107,15 @@ class ValidationJudge:
         }
         
         try:
-            response = requests.post(
+            response = self.session.post(
                 self.base_url,
-                headers=self.get_headers(),
-                json=payload
+                # Content-Type: application/json is preset on the session
+                data=orjson.dumps(payload),
+                timeout=(5, 60)  # fail fast on connect, allow slow judge generations
             )
             response.raise_for_status()
             
-            result = response.json()
+            result = orjson.loads(response.content)
             judgment_text = result['choices'][0]['message']['content']
             
             # Parse the structured response
@@ -202,11 +222,11 @@ class ValidationJudge:
         """Parse the structured judgment response"""
         try:
             # Extract scores using regex
-            baseline_score = re.search(r'BASELINE_SCORE:\s*(\d+)', judgment_text)
-            rag_score = re.search(r'RAG_SCORE:\s*(\d+)', judgment_text)
-            baseline_reasoning = re.search(r'BASELINE_REASONING:\s*(.+?)(?=RAG_REASONING|WINNER|$)', judgment_text, re.DOTALL)
-            rag_reasoning = re.search(r'RAG_REASONING:\s*(.+?)(?=WINNER|$)', judgment_text, re.DOTALL)
-            winner = re.search(r'WINNER:\s*(\w+)', judgment_text)
+            baseline_score = _BASELINE_SCORE_RE.search(judgment_text)
+            rag_score = _RAG_SCORE_RE.search(judgment_text)
+            baseline_reasoning = _BASELINE_REASONING_RE.search(judgment_text)
+            rag_reasoning = _RAG_REASONING_RE.search(judgment_text)
+            winner = _WINNER_RE.search(judgment_text)
             
             return {
                 "baseline_score": int(baseline_score.group(1)) if baseline_score else 0,
@@ -1,12 +1,128 @@
+import itertools
 import os
-from typing import Dict, Any, List, Optional
+import threading
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple, Union
 from datetime import datetime
 import numpy as np
+import ijson
+import orjson
 import chromadb
+from chromadb.errors import NotFoundError
 import chromadb.utils.embedding_functions as embedding_functions
 from dotenv import load_dotenv
 load_dotenv()
 
+# HNSW index settings applied when a collection is first created. Construction
+# parameters (max_neighbors, ef_construction) are fixed once the index exists;
+# ef_search can still be changed later through `collection.modify`.
+DEFAULT_HNSW_CONFIG: Dict[str, Any] = {
+    "space": "cosine",
+    "max_neighbors": 24,  # a.k.a. M, graph connectivity
+    "ef_construction": 128,  # controls how well the index is constructed
+    "ef_search": 100,  # candidate list size at query time (recall vs. speed)
+}
+
+# How many times a search that hits hnswlib's "contiguous 2D array" error is
+# retried, doubling ef_search each time
+SEARCH_EF_RETRIES = 3
+
+# Records per collection.add call when bulk loading; large batches mean fewer SQLite transactions
+DEFAULT_ADD_BATCH_SIZE = 5000
+
+# load_from_json fills "<name><suffix>" and renames it once every record is in
+STAGING_SUFFIX = "__loading"
+
+
+def normalize_rows(vectors: Union[List[List[float]], np.ndarray]) -> np.ndarray:
+    """
+    Scale every row of an (N, D) batch to unit L2 norm in one vectorized pass
+    
+    Cosine collections expect unit-length vectors. Zero rows are left as zeros
+    instead of turning into NaNs.
+    
+    Args:
+        vectors: Batch of embeddings (a single 1-D vector is treated as one row)
+        
+    Returns:
+        New contiguous float32 array of shape (N, D); the input is not modified
+    """
+    matrix = np.array(vectors, dtype=np.float32, ndmin=2)
+    _normalize_chunk(matrix)
+    return matrix
+
+
+def _normalize_chunk(chunk: np.ndarray) -> None:
+    """Scale the rows of a float32 block to unit L2 norm in place (zero rows stay zero)"""
+    # einsum reduces each row's squares directly; np.linalg.norm would first
+    # materialize a full (N, D) temporary of x * x
+    norms = np.sqrt(np.einsum("ij,ij->i", chunk, chunk))[:, None]
+    np.divide(chunk, norms, out=chunk, where=norms > 0)
+
+
+# VizWiz collects 10 crowd answers per question; each gets its own scalar metadata field
+MAX_CROWD_ANSWER_FIELDS = 10
+
+
+def crowd_answer_fields(crowd_answers: Union[List[str], str]) -> Dict[str, Any]:
+    """
+    Columnar metadata for a list of crowd answers: `crowd_answers_count` plus
+    `ca_0` .. `ca_9`, so Chroma can filter on them directly (e.g. where={"ca_0": "yes"})
+    
+    Args:
+        crowd_answers: Answers as a list or as the stored "|"-joined string
+        
+    Returns:
+        Dictionary of metadata fields to merge into a record
+    """
+    if isinstance(crowd_answers, str):
+        crowd_answers = crowd_answers.split("|") if crowd_answers else []
+    fields: Dict[str, Any] = {"crowd_answers_count": len(crowd_answers)}
+    for i, answer in enumerate(crowd_answers[:MAX_CROWD_ANSWER_FIELDS]):
+        fields[f"ca_{i}"] = answer
+    return fields
+
+
+def recommended_ef_search(n_results: int) -> int:
+    """HNSW query breadth giving high recall for top-`n_results` queries: max(40, 10 * n_results)"""
+    return max(40, 10 * n_results)
+
+
+def load_embedding_matrix(json_path: Union[str, Path]) -> Tuple[np.ndarray, Dict[str, int]]:
+    """
+    Load the embeddings of an exported embeddings JSON file as one (N, D) float32 matrix
+    
+    The first call converts the JSON into two sidecar files next to it:
+    `<name>.npy` with the matrix and `<name>.ids.json` with the row order.
+    Later calls memory-map the .npy, so only the rows actually read are paged in.
+    The sidecars are rebuilt whenever the JSON file is newer.
+    
+    Args:
+        json_path: Path to a `{"items": [{"id", "embedding", ...}]}` embeddings file
+        
+    Returns:
+        Tuple of (read-only matrix, mapping of item ID -> row index)
+    """
+    json_path = Path(json_path)
+    npy_path = json_path.with_suffix(".npy")
+    ids_path = json_path.with_suffix(".ids.json")
+    
+    json_mtime = json_path.stat().st_mtime
+    if not (npy_path.exists() and ids_path.exists()
+            and min(npy_path.stat().st_mtime, ids_path.stat().st_mtime) >= json_mtime):
+        items = orjson.loads(json_path.read_bytes()).get("items", [])
+        # Embeddings are stored as [[...]] (one vector per item); flatten that wrapper
+        matrix = np.asarray([item["embedding"] for item in items], dtype=np.float32)
+        matrix = matrix.reshape(len(items), -1)
+        np.save(npy_path, matrix)
+        ids_path.write_bytes(orjson.dumps([str(item["id"]) for item in items]))
+        print(f"Wrote embedding sidecars for {json_path.name}: {matrix.shape}")
+    
+    ids = orjson.loads(ids_path.read_bytes())
+    matrix = np.load(npy_path, mmap_mode="r")
+    return matrix, {item_id: row for row, item_id in enumerate(ids)}
+
+
 class SimpleVectorDB:
     def __init__(self, db_path="./data/chroma_db"):
         """
@@ -23,54 +139,122 @@ class SimpleVectorDB:
         self.db_path = db_path
         self.current_collection = None
         self.current_collection_name = None
+        # Configured query-time ef per collection, and collections whose ef cannot be modified
+        self._ef_search: Dict[str, int] = {}
+        self._ef_search_frozen: Set[str] = set()
+        # Collection handles by (name, embed_documents), so repeated lookups skip the
+        # client round trip, plus the HNSW settings each name was opened with
+        self._collections: Dict[Tuple[str, bool], Any] = {}
+        self._hnsw_configs: Dict[str, Dict[str, Any]] = {}
+        # Read-only handles opened without an embedding function (see _get_collection)
+        self._query_collections: Dict[str, Any] = {}
+        self._embedding_fn = None
+        # Stored IDs per collection, loaded on the first check_if_exists and kept in sync by adds
+        self._id_caches: Dict[str, Set[str]] = {}
+        # Per-thread scratch vector for query normalization (searches run from worker threads)
+        self._query_buf = threading.local()
+        # (directory mtime, entry names) from the last verify_persistence scan
+        self._db_listing: Optional[Tuple[int, List[str]]] = None
         
         print(f"Vector DB initialized at: {db_path}")
         print(f"Persistence enabled: Data will be saved to disk")
     
-    def create_collection(self, collection_name: str, description: str = ""):
+    def create_collection(
+        self,
+        collection_name: str,
+        description: str = "",
+        hnsw_config: Optional[Dict[str, Any]] = None,
+        embed_documents: bool = True
+    ):
         """
         Create or get an existing collection
         
         Args:
             collection_name: Name of the collection
             description: Description of what this collection contains
+            hnsw_config: Optional overrides for DEFAULT_HNSW_CONFIG (only used on creation;
+                a different config for an already opened collection is ignored with a warning)
+            embed_documents: Attach the Cohere embedding function. Set False when every
+                add supplies precomputed (already normalized) vectors, so no text is ever
+                sent to Cohere; adds without embeddings then fail instead
             
         Returns:
-            The collection object
+            The collection object (cached per name and `embed_documents`)
         """
-        metadata = {"description": description} if description else {}
+        hnsw = {**DEFAULT_HNSW_CONFIG, **(hnsw_config or {})}
+        key = (collection_name, embed_documents)
+        opened_with = self._hnsw_configs.get(collection_name)
+        if opened_with is not None and hnsw_config is not None and hnsw != opened_with:
+            # HNSW settings only apply when a collection is created
+            print(f"Warning: collection '{collection_name}' is already open with HNSW config "
+                  f"{opened_with}; ignoring {hnsw}")
+        if key in self._collections:
+            return self._collections[key]
+        
+        # Chroma rejects an empty metadata dict; pass None when there is nothing to store
+        metadata = {"description": description} if description else None
         
-        multimodal_cohere_ef = embedding_functions.CohereEmbeddingFunction(
-            model_name="embed-v4.0",
-            api_key=os.getenv("COHERE_API_KEY"),
-        )   
-
-
         # collection with distance metric, COSINE similarity
         collection = self.client.get_or_create_collection(
             name=collection_name,
             metadata=metadata,
-            embedding_function=multimodal_cohere_ef,
+            embedding_function=self._cohere_embedding_function() if embed_documents else None,
             configuration={
-                "hnsw": {
-                    "space": "cosine",
-                    "ef_construction": 100 # default. controls how well the index is constructed. 
-                }
+                "hnsw": hnsw
             }
         )
+        self._collections[key] = collection
+        self._hnsw_configs.setdefault(collection_name, hnsw)
         
         print(f"Collection '{collection_name}' ready")
         return collection
     
-    def use_collection(self, collection_name: str, description: str = ""):
+    def _cohere_embedding_function(self):
+        """Single Cohere embedding function (and API client) shared by every collection"""
+        if self._embedding_fn is None:
+            self._embedding_fn = embedding_functions.CohereEmbeddingFunction(
+                model_name="embed-v4.0",
+                api_key=os.getenv("COHERE_API_KEY"),
+            )
+        return self._embedding_fn
+    
+    def _get_collection(self, collection_name: str):
+        """
+        Return an existing collection without creating it
+        
+        The handle is opened without an embedding function: searches always pass
+        precomputed query embeddings, so read-only use needs neither the cohere
+        package nor COHERE_API_KEY. Use create_collection for text adds.
+        
+        Args:
+            collection_name: Name of the collection
+            
+        Returns:
+            The (cached) collection object
+        """
+        # A handle from create_collection works for queries too
+        for embed_documents in (True, False):
+            if (collection_name, embed_documents) in self._collections:
+                return self._collections[(collection_name, embed_documents)]
+        if collection_name not in self._query_collections:
+            try:
+                self._query_collections[collection_name] = self.client.get_collection(
+                    collection_name, embedding_function=None
+                )
+            except NotFoundError as e:
+                raise ValueError(f"Collection '{collection_name}' does not exist: {e}") from e
+        return self._query_collections[collection_name]
+    
+    def use_collection(self, collection_name: str, description: str = "", hnsw_config: Optional[Dict[str, Any]] = None):
         """
         Set the current working collection
         
         Args:
             collection_name: Name of the collection to use
             description: Description for new collections
+            hnsw_config: Optional HNSW overrides for new collections
         """
-        self.current_collection = self.create_collection(collection_name, description)
+        self.current_collection = self.create_collection(collection_name, description, hnsw_config)
         self.current_collection_name = collection_name
         print(f"Now using collection: {collection_name}")
     
@@ -105,7 +289,7 @@ class SimpleVectorDB:
         
         print(f"Database contains {len(info)} collections:")
         for name, details in info.items():
-            print(f"  • {name}: {details['count']} items - {details['metadata'].get('description', 'No description')}")
+            print(f"  • {name}: {details['count']} items - {(details['metadata'] or {}).get('description', 'No description')}")
         
         return info
     
@@ -150,17 +334,10 @@ class SimpleVectorDB:
                 self.current_collection = collection
                 self.current_collection_name = "default_embeddings"
             
-            # Create metadata with all VizWiz fields
-            metadata = {
-                "question": question,
-                "timestamp": datetime.now().isoformat(),
-                "id": embedding_id,
-                "answerability": answerability,
-                "question_type": question_type,
-                "image_url": image_url,
-                "crowd_answers": "|".join(crowd_answers) if crowd_answers else "",
-                "crowd_majority": crowd_majority
-            }
+            metadata = self._build_metadata(
+                embedding_id, question, answerability, question_type,
+                image_url, crowd_answers, crowd_majority, datetime.now().isoformat()
+            )
             
             # Add embedding to collection with the specific ID (FIXED: embeddings must be a list)
             collection.add(
@@ -168,6 +345,8 @@ class SimpleVectorDB:
                 metadatas=[metadata],
                 ids=[embedding_id]
             )
+            if collection.name in self._id_caches:
+                self._id_caches[collection.name].add(embedding_id)
             
             collection_name_used = collection_name or self.current_collection_name or "default_embeddings"
             print(f"Added embedding {embedding_id} to collection '{collection_name_used}' (persisted to disk)")
@@ -177,19 +356,250 @@ class SimpleVectorDB:
             print(f"Error adding embedding {embedding_id}: {e}")
             raise
     
+    def add_image_embeddings_batch(
+        self,
+        embedding_ids: List[str],
+        image_embeddings: Union[List[List[float]], np.ndarray],
+        questions: List[str],
+        answerabilities: List[str],
+        question_types: List[str],
+        image_urls: List[str],
+        crowd_answers: List[List[str]],
+        crowd_majorities: List[str],
+        collection_name: Optional[str] = None,
+        batch_size: int = DEFAULT_ADD_BATCH_SIZE,
+        timestamp: Optional[str] = None
+    ) -> List[str]:
+        """
+        Add many image embeddings at once (parallel lists, one entry per image)
+        
+        Rows are submitted in chunks of `batch_size` per `collection.add` call,
+        so the per-insert overhead is paid once per chunk instead of per image.
+        
+        Args:
+            embedding_ids: Specific ID for each embedding
+            image_embeddings: (N, D) embeddings, as nested lists or a float32 array
+            questions: The visual question asked for each image
+            answerabilities: Whether each question is answerable
+            question_types: Type of each question
+            image_urls: Original VizWiz image URLs
+            crowd_answers: Crowd-sourced answers for each image
+            crowd_majorities: Majority crowd answer for each image
+            collection_name: Optional collection name (uses current if None)
+            batch_size: Rows per `collection.add` call (capped at Chroma's max batch size)
+            timestamp: Optional ISO timestamp stored on every row (defaults to now)
+            
+        Returns:
+            The embedding IDs that were added
+        """
+        if collection_name:
+            collection = self.create_collection(collection_name)
+        elif self.current_collection:
+            collection = self.current_collection
+        else:
+            raise ValueError("No collection specified")
+        
+        # One timestamp for the whole batch
+        timestamp = timestamp or datetime.now().isoformat()
+        metadatas = [
+            self._build_metadata(*fields, timestamp)
+            for fields in zip(embedding_ids, questions, answerabilities, question_types,
+                              image_urls, crowd_answers, crowd_majorities)
+        ]
+        embeddings = np.asarray(image_embeddings, dtype=np.float32)
+        
+        batch_size = min(batch_size, self.client.get_max_batch_size())
+        for start in range(0, len(embedding_ids), batch_size):
+            end = start + batch_size
+            collection.add(
+                ids=embedding_ids[start:end],
+                embeddings=embeddings[start:end],
+                metadatas=metadatas[start:end]
+            )
+        
+        if collection.name in self._id_caches:
+            self._id_caches[collection.name].update(embedding_ids)
+        print(f"Added {len(embedding_ids)} embeddings to collection '{collection.name}' (persisted to disk)")
+        return list(embedding_ids)
+    
+    @staticmethod
+    def _build_metadata(
+        embedding_id: str,
+        question: str,
+        answerability: str,
+        question_type: str,
+        image_url: str,
+        crowd_answers: List[str],
+        crowd_majority: str,
+        timestamp: str
+    ) -> Dict[str, Any]:
+        """Metadata record with all VizWiz fields, as stored alongside each embedding"""
+        return {
+            "question": question,
+            "timestamp": timestamp,
+            "id": embedding_id,
+            "answerability": answerability,
+            "question_type": question_type,
+            "image_url": image_url,
+            # Joined string kept for full reconstruction; ca_* fields are for filtering
+            "crowd_answers": "|".join(crowd_answers) if crowd_answers else "",
+            **crowd_answer_fields(crowd_answers or []),
+            "crowd_majority": crowd_majority
+        }
+    
+    def load_from_json(
+        self,
+        file_path: Union[str, Path],
+        collection_name: str,
+        normalize_embeddings: bool = False,
+        description: str = "",
+        hnsw_config: Optional[Dict[str, Any]] = None,
+        batch_size: int = DEFAULT_ADD_BATCH_SIZE,
+        embed_documents: bool = True
+    ) -> int:
+        """
+        (Re)build a collection from an exported embeddings JSON file
+        
+        The records are loaded into a temporary collection that replaces any
+        existing collection with the same name only once it is complete, so the
+        HNSW settings in `hnsw_config` take effect and a bad file or failed add
+        leaves the old collection intact. Items are streamed from the file
+        with ijson and copied into a reused (batch_size, D) float32 buffer, which
+        is optionally normalized in place and added once full, so peak memory
+        stays at one batch instead of the whole file.
+        
+        Args:
+            file_path: Path to a `{"items": [{"id", "embedding", "metadata"}]}` file
+            collection_name: Name of the collection to (re)create
+            normalize_embeddings: Normalize vectors before storing (needed for OpenCLIP)
+            description: Description for the collection
+            hnsw_config: Optional overrides for DEFAULT_HNSW_CONFIG (e.g. {"space": "l2"})
+            batch_size: Records per `collection.add` call (capped at Chroma's max batch size)
+            embed_documents: Attach the Cohere embedding function to the new collection
+                (pass False when it will only ever receive precomputed vectors)
+            
+        Returns:
+            Number of records in the collection after loading
+        """
+        with open(file_path, "rb") as f:
+            records = self._iter_json_records(f)
+            # Peek before dropping anything so a bad file leaves the old collection intact
+            first = next(records, None)
+            if first is None:
+                raise ValueError(f"No valid records found in {file_path}")
+            
+            staging_name = f"{collection_name}{STAGING_SUFFIX}"
+            existing = self.list_collections()
+            if staging_name in existing:
+                # Left over from an interrupted load
+                self.delete_collection(staging_name)
+            collection = self.create_collection(staging_name, description, hnsw_config, embed_documents)
+            
+            batch_size = min(batch_size, self.client.get_max_batch_size())
+            dim = len(first[1])
+            buffer = np.empty((batch_size, dim), dtype=np.float32)
+            ids: List[str] = []
+            metadatas: List[Dict[str, Any]] = []
+            
+            def flush() -> None:
+                filled = buffer[:len(ids)]
+                if normalize_embeddings:
+                    _normalize_chunk(filled)
+                collection.add(
+                    ids=ids,
+                    embeddings=filled,
+                    metadatas=metadatas,
+                    documents=[m.get("question", f"Item {i}") for i, m in zip(ids, metadatas)]
+                )
+                ids.clear()
+                metadatas.clear()
+            
+            try:
+                for record_id, vector, metadata in itertools.chain([first], records):
+                    if len(vector) != dim:
+                        raise ValueError(
+                            f"Embedding for record '{record_id}' has dimension {len(vector)}, "
+                            f"expected {dim} (from the first record) in {file_path}"
+                        )
+                    buffer[len(ids)] = vector
+                    ids.append(record_id)
+                    metadatas.append(metadata)
+                    if len(ids) == batch_size:
+                        flush()
+                if ids:
+                    flush()
+            except BaseException:
+                self.delete_collection(staging_name)
+                raise
+        
+        # Swap the complete collection in under the requested name
+        if collection_name in existing:
+            self.delete_collection(collection_name)
+        collection.modify(name=collection_name)
+        hnsw = self._hnsw_configs[staging_name]
+        self._forget_collection(staging_name)
+        self._collections[(collection_name, embed_documents)] = collection
+        self._hnsw_configs[collection_name] = hnsw
+        
+        count = collection.count()
+        print(f"Loaded {count} embeddings into '{collection_name}' (persisted to disk)")
+        return count
+    
+    @staticmethod
+    def _iter_json_records(f) -> Iterator[Tuple[str, List[float], Dict[str, Any]]]:
+        """Stream (id, vector, metadata) for each valid item of an embeddings JSON file"""
+        for item in ijson.items(f, "items.item", use_float=True):
+            embedding = item.get("embedding")
+            if "id" not in item or "metadata" not in item or not embedding:
+                continue
+            # Embeddings are stored as [[...]] (one vector per item); unwrap that
+            vector = embedding[0] if isinstance(embedding[0], list) else embedding
+            metadata = item["metadata"]
+            # Older exports only have the joined string; add the per-answer fields
+            if "crowd_answers" in metadata and "crowd_answers_count" not in metadata:
+                metadata.update(crowd_answer_fields(metadata["crowd_answers"]))
+            yield str(item["id"]), vector, metadata
+    
+    def _normalize_query(self, query_embedding: Union[List[float], np.ndarray]) -> np.ndarray:
+        """Unit-normalize a query into this thread's reused float32 buffer (no allocation once sized)"""
+        buf = getattr(self._query_buf, "array", None)
+        if buf is None or buf.shape[0] != len(query_embedding):
+            buf = self._query_buf.array = np.empty(len(query_embedding), dtype=np.float32)
+        np.copyto(buf, query_embedding)
+        norm = np.linalg.norm(buf)
+        if norm > 0:
+            buf /= norm
+        return buf
+    
     def search_similar_images(
         self, 
-        query_embedding: List[float], 
+        query_embedding: Union[List[float], np.ndarray], 
         n_results: int = 5,
-        collection_name: Optional[str] = None
+        collection_name: Optional[str] = None,
+        ef_search: Optional[int] = None,
+        normalized: bool = False,
+        where: Optional[Dict[str, Any]] = None,
+        where_document: Optional[Dict[str, Any]] = None,
+        as_arrays: bool = False
     ) -> Dict[str, Any]:
         """
         Find similar image embeddings in a collection
         
+        Filters are applied inside Chroma during the HNSW search instead of on
+        the returned results. Selective filters (e.g. {"question_type": "other"}
+        or {"ca_0": "yes"}) cut down the candidates that get distance-scored.
+        
         Args:
-            query_embedding: The embedding to search for
+            query_embedding: The embedding to search for (list or float32 array)
             n_results: Number of similar images to return
             collection_name: Optional collection name (uses current if None)
+            ef_search: Optional minimum HNSW search breadth; the collection's configured ef is
+                used as-is when it is already at least this large (it is never lowered)
+            normalized: Set when the query is already a unit-length float32 vector to skip re-normalizing it
+            where: Optional Chroma metadata filter
+            where_document: Optional Chroma document filter (e.g. {"$contains": "label"})
+            as_arrays: Return "ids" / "distances" as NumPy arrays plus a "metadatas" list
+                instead of one dict per result (cheaper for large n_results)
             
         Returns:
             Dictionary with search results
@@ -197,19 +607,52 @@ class SimpleVectorDB:
         try:
             # Use specified collection or current collection
             if collection_name:
-                if collection_name in [col.name for col in self.client.list_collections()]:
-                    collection = self.client.get_collection(collection_name)
-                else:
-                    raise ValueError(f"Collection '{collection_name}' does not exist")
+                collection = self._get_collection(collection_name)
+            elif self.current_collection:
+                collection = self.current_collection
+            else:
+                raise ValueError("No collection specified")
             
-            # normalize query embedding for COSINE similarity
-            norm_query = (np.array(query_embedding) / np.linalg.norm(query_embedding)).tolist()
+            if ef_search is not None:
+                self._ensure_ef_search(collection, ef_search)
             
-            results = collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results
+            # normalize query embedding for COSINE similarity; Chroma takes the
+            # float32 array as-is, so no per-query list conversion is needed
+            norm_query = (
+                np.asarray(query_embedding, dtype=np.float32) if normalized
+                else self._normalize_query(query_embedding)
             )
             
+            current_ef = max(self._configured_ef_search(collection), n_results)
+            for attempt in range(SEARCH_EF_RETRIES + 1):
+                try:
+                    results = collection.query(
+                        query_embeddings=[norm_query],
+                        n_results=n_results,
+                        where=where,
+                        where_document=where_document
+                    )
+                    break
+                except Exception as e:
+                    # hnswlib fails with "Cannot return the results in a contigious 2D array"
+                    # when ef_search is too small to collect n_results; widen and retry
+                    if "2D array" not in str(e) or attempt == SEARCH_EF_RETRIES:
+                        raise
+                    current_ef *= 2
+                    if not self._ensure_ef_search(collection, current_ef):
+                        raise
+                    print(f"Retrying search with ef_search={current_ef} "
+                          f"(consider raising the default ef_search): {e}")
+            
+            if as_arrays:
+                return {
+                    "ids": np.asarray(results["ids"][0], dtype=object),
+                    "distances": np.asarray(results["distances"][0], dtype=np.float32),
+                    "metadatas": results["metadatas"][0],
+                    "count": len(results["ids"][0]),
+                    "collection": collection_name or self.current_collection_name
+                }
+            
             # Format results
             similar_images = []
             for i, embedding_id in enumerate(results["ids"][0]):
@@ -228,6 +671,90 @@ class SimpleVectorDB:
             print(f"Error searching collection: {e}")
             return {"similar_images": [], "count": 0, "error": str(e)}
     
+    def _configured_ef_search(self, collection) -> int:
+        """Query-time HNSW ef the collection was created (or last tuned) with"""
+        if collection.name not in self._ef_search:
+            try:
+                # Raw JSON: building the full configuration would instantiate its embedding function
+                ef = (collection.configuration_json or {}).get("hnsw", {}).get("ef_search")
+            except Exception:
+                ef = None
+            self._ef_search[collection.name] = ef or DEFAULT_HNSW_CONFIG["ef_search"]
+        return self._ef_search[collection.name]
+    
+    def _ensure_ef_search(self, collection, ef_search: int) -> bool:
+        """
+        Make sure a collection searches with at least `ef_search` candidates
+        
+        ef_search is set when the collection is created; this only writes the
+        (persisted) configuration when a larger value is really needed, and at
+        most until the first failed attempt per collection.
+        
+        Args:
+            collection: The collection object to tune
+            ef_search: Minimum size of the candidate list explored per query
+            
+        Returns:
+            True if the collection now uses at least `ef_search`
+        """
+        if self._configured_ef_search(collection) >= ef_search:
+            return True
+        if collection.name in self._ef_search_frozen:
+            return False
+        
+        try:
+            collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+        except Exception as e:
+            # e.g. the stored config references an embedding function that cannot be
+            # built here; keep searching with the configured ef instead of failing
+            print(f"Could not raise ef_search of '{collection.name}' to {ef_search} "
+                  f"(keeping {self._ef_search[collection.name]}): {e}")
+            self._ef_search_frozen.add(collection.name)
+            return False
+        self._ef_search[collection.name] = ef_search
+        return True
+    
+    def warm_up(self, collection_name: Optional[str] = None, background: bool = True) -> Optional[threading.Thread]:
+        """
+        Page a collection's index files into the OS cache and load its HNSW graph
+        
+        Without this the first similarity search pays for every cold disk read.
+        
+        Args:
+            collection_name: Optional collection name (uses current if None)
+            background: Run in a daemon thread so startup is not blocked
+            
+        Returns:
+            The warm-up thread when `background` is True, otherwise None
+        """
+        if background:
+            thread = threading.Thread(target=self.warm_up, args=(collection_name, False), daemon=True)
+            thread.start()
+            return thread
+        
+        try:
+            # Hint the kernel to read the sqlite file and HNSW segment files ahead
+            if hasattr(os, "posix_fadvise"):
+                for root, _, files in os.walk(self.db_path):
+                    for file_name in files:
+                        fd = os.open(os.path.join(root, file_name), os.O_RDONLY)
+                        try:
+                            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+                        finally:
+                            os.close(fd)
+            
+            collection = self._get_collection(collection_name) if collection_name else self.current_collection
+            if collection is None:
+                return None
+            
+            # One real query forces Chroma to load the HNSW graph into memory
+            sample = collection.get(limit=1, include=["embeddings"])
+            if len(sample["embeddings"]):
+                collection.query(query_embeddings=[sample["embeddings"][0]], n_results=1)
+        except Exception as e:
+            print(f"Warm-up of collection skipped: {e}")
+        return None
+    
     def check_if_exists(self, embedding_id: str, collection_name: Optional[str] = None) -> bool:
         """
         Check if an embedding with this ID already exists in a collection
@@ -248,8 +775,12 @@ class SimpleVectorDB:
             else:
                 return False
             
-            result = collection.get(ids=[embedding_id])
-            return len(result["ids"]) > 0
+            ids = self._id_caches.get(collection.name)
+            if ids is None:
+                # One ID-only scan instead of a lookup per check
+                ids = set(collection.get(include=[])["ids"])
+                self._id_caches[collection.name] = ids
+            return embedding_id in ids
         except:
             return False
     
@@ -283,6 +814,14 @@ class SimpleVectorDB:
         except Exception as e:
             return {"total_images": 0, "collection_name": "Error", "error": str(e)}
     
+    def _list_db_files(self) -> List[str]:
+        """Entry names in the database directory, rescanned only when its mtime changes"""
+        mtime = os.stat(self.db_path).st_mtime_ns
+        if self._db_listing is None or self._db_listing[0] != mtime:
+            with os.scandir(self.db_path) as it:
+                self._db_listing = (mtime, [entry.name for entry in it])
+        return list(self._db_listing[1])
+    
     def verify_persistence(self) -> Dict[str, Any]:
         """
         Verify that data is properly persisted to disk
@@ -295,9 +834,7 @@ class SimpleVectorDB:
             db_exists = os.path.exists(self.db_path)
             
             # Check if there are any files in the database directory
-            db_files = []
-            if db_exists:
-                db_files = os.listdir(self.db_path)
+            db_files = self._list_db_files() if db_exists else []
             
             # Get collection info
             collections = self.list_collections()
@@ -333,6 +870,7 @@ class SimpleVectorDB:
         """
         try:
             self.client.delete_collection(collection_name)
+            self._forget_collection(collection_name)
             print(f"Deleted collection: {collection_name} (change persisted to disk)")
             
             # Reset current collection if it was deleted
@@ -341,6 +879,16 @@ class SimpleVectorDB:
                 self.current_collection_name = None
         except Exception as e:
             print(f"Error deleting collection {collection_name}: {e}")
+    
+    def _forget_collection(self, collection_name: str) -> None:
+        """Drop every cached handle and setting kept for a collection name"""
+        self._collections.pop((collection_name, True), None)
+        self._collections.pop((collection_name, False), None)
+        self._hnsw_configs.pop(collection_name, None)
+        self._query_collections.pop(collection_name, None)
+        self._ef_search.pop(collection_name, None)
+        self._ef_search_frozen.discard(collection_name)
+        self._id_caches.pop(collection_name, None)
 
 
 if __name__ == "__main__":
@@ -1,17 +1,23 @@
-import openai
 from openai import OpenAI
 import anthropic
 from google import genai
 from google.genai.types import Content, Part, Tool, GenerateContentConfig, GoogleSearch
 from google.genai import errors
 import requests
-import yaml
+from requests.adapters import HTTPAdapter
+from concurrent.futures import Future, ThreadPoolExecutor
+from utils import load_yaml, _is_failed_response
+from llm_cache import LLMCache, DEFAULT_CACHE_DIR
 from pathlib import Path
 from typing import Union, List, Dict, Tuple, Optional
-import time, threading
-from collections import deque
+import itertools
+import time, threading, random
 import base64
+import io
+import os
 import mimetypes
+import functools
+import orjson
 
 
 def load_api_keys():
@@ -22,54 +28,186 @@ def load_api_keys():
             "api_keys.yml not found. Please add api_keys.yml to configs "
             "and fill in your API keys."
         )
-    with open(api_keys_path) as f:
-        return yaml.safe_load(f)
+    return load_yaml(api_keys_path)
 
 # Load API keys once at module level
 API_KEYS = load_api_keys()
 
+
+def _provider_keys(provider: str) -> List[str]:
+    """API keys for a provider: a list under `api_keys`, or the single `api_key`."""
+    cfg = API_KEYS[provider]
+    return list(cfg.get("api_keys") or [cfg["api_key"]])
+
+
+# Shared session: image downloads reuse pooled keep-alive connections (and TLS
+# sessions) across images, models and calls
+_HTTP = requests.Session()
+_HTTP.mount("http://", HTTPAdapter(pool_connections=32, pool_maxsize=32))
+_HTTP.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32))
+
+# Upper bound on concurrent downloads when one message carries several images
+_MAX_IMAGE_FETCH_WORKERS = 8
+
+# Longest image side sent to providers; they downsample larger images server-side
+# anyway (Anthropic's limit is 1568 px), so bigger uploads only cost bandwidth
+MAX_IMAGE_SIDE = 1568
+
+
+def _downscale_image(image_bytes: bytes, mime_type: str) -> Tuple[bytes, str]:
+    """Shrink an image so its longest side is at most MAX_IMAGE_SIDE; smaller images are returned untouched."""
+    # Imported lazily so importing the model classes does not load Pillow
+    from PIL import Image, ImageOps
+
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        if max(img.size) <= MAX_IMAGE_SIDE:
+            return image_bytes, mime_type
+        # Re-encoding drops the EXIF Orientation tag, so bake the rotation into the pixels
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.LANCZOS)
+    except Exception as e:
+        print(f"[WARN] Could not downscale image ({e}); sending it unchanged.")
+        return image_bytes, mime_type
+
+    buf = io.BytesIO()
+    if img.mode in ("RGBA", "LA") or "transparency" in img.info:
+        # keep transparency only where it exists
+        img.save(buf, format="PNG", optimize=True)
+        return buf.getvalue(), "image/png"
+    img.convert("RGB").save(buf, format="JPEG", quality=85, optimize=True)
+    return buf.getvalue(), "image/jpeg"
+
+
+@functools.lru_cache(maxsize=256)
+def _fetch_image(url: str) -> Tuple[bytes, str]:
+    """Download a remote image once and return (bytes, mime type).
+
+    Evaluation sends the same image to every model and context mode, so
+    repeated requests for a URL are served from memory. Oversized images
+    are downscaled once, before caching.
+    """
+    response = _HTTP.get(url, timeout=10)
+    response.raise_for_status()
+    return _downscale_image(response.content, response.headers.get("Content-Type", "image/jpeg"))
+
+@functools.lru_cache(maxsize=256)
+def _read_local_image(path: str, mtime: float) -> Tuple[bytes, str]:
+    """Read (and if needed downscale) a local image once per (path, mtime) and guess its mime type."""
+    mime_type, _ = mimetypes.guess_type(path)
+    return _downscale_image(Path(path).read_bytes(), mime_type or "image/jpeg")
+
+
+def _load_image(url: str) -> Tuple[bytes, str]:
+    """Return (bytes, mime type) for a data URI, an http(s) URL or a local path."""
+    if url.startswith("data:"):
+        header, data_part = url.split(",", 1)
+        return base64.b64decode(data_part), header.split(";")[0][5:] or "image/jpeg"
+    if url.startswith("http"):
+        return _fetch_image(url)
+    return _read_local_image(url, os.path.getmtime(url))
+
+
+def _load_images(urls: List[str]) -> List[Union[Tuple[bytes, str], Exception]]:
+    """_load_image for every URL, downloading several at once; failures are returned in place."""
+    def load(url: str) -> Union[Tuple[bytes, str], Exception]:
+        try:
+            return _load_image(url)
+        except Exception as e:
+            return e
+
+    if len(urls) <= 1:
+        return [load(url) for url in urls]
+    with ThreadPoolExecutor(max_workers=min(_MAX_IMAGE_FETCH_WORKERS, len(urls))) as pool:
+        return list(pool.map(load, urls))
+
+
+@functools.lru_cache(maxsize=256)
+def _base64_image(image_bytes: bytes) -> str:
+    """Base64 text of an image; the cached bytes objects above keep their hash, so lookups are cheap."""
+    return base64.b64encode(image_bytes).decode("ascii")
+
 # Base interface
 class BaseModel:
 
-    _LOCK          = threading.Lock()
-    _WINDOWS       = {}   
+    _LOCK          = threading.Lock()   # guards registration and _INFLIGHT
+    _BUCKETS       = {}   # model -> one {"tokens", "last", "lock"} token bucket per API key
     _RATE_LIMITS   = {}
+    _CACHE         = None  # optional LLMCache shared by every model
+    _INFLIGHT      = {}    # request key -> Future of the identical call currently running
 
 
     @classmethod
-    def set_rate_limit(cls, model_name: str, rpm: int):
-        """Register or update a requests-per-minute limit for a model slug."""
+    def enable_cache(cls, cache_dir: Optional[Union[str, Path]] = None):
+        """Serve byte-identical requests from an on-disk exact-match cache (see llm_cache.py)."""
+        cls._CACHE = LLMCache(cache_dir or DEFAULT_CACHE_DIR)
+
+    @classmethod
+    def set_rate_limit(cls, model_name: str, rpm: int, n_keys: int = 1):
+        """Register or update a per-key requests-per-minute limit for a model slug."""
         with cls._LOCK:
             cls._RATE_LIMITS[model_name] = rpm
-            cls._WINDOWS.setdefault(model_name, deque())
+            buckets = cls._BUCKETS.setdefault(model_name, [])
+            while len(buckets) < n_keys:
+                buckets.append({
+                    "tokens": float(rpm),
+                    "last":   time.monotonic(),
+                    "lock":   threading.Lock(),
+                })
+            for bucket in buckets:
+                with bucket["lock"]:
+                    bucket["tokens"] = min(bucket["tokens"], float(rpm))
 
-    def __init__(self, name: str):
+    def __init__(self, name: str, n_keys: int = 1):
         self.name = name
-        BaseModel.set_rate_limit(self.name, BaseModel._RATE_LIMITS.get(self.name, 10))
+        # Index of the API key (client) picked for the current thread's request
+        self._key_slot = threading.local()
+        self._next_key = itertools.count()
+        BaseModel.set_rate_limit(self.name, BaseModel._RATE_LIMITS.get(self.name, 10), n_keys)
 
-    def _block_if_needed(self):
-        """
-        Ensure this model stays below its RPM.
-        Called immediately before every network request.
-        """
-        rpm   = BaseModel._RATE_LIMITS[self.name]
-        win   = BaseModel._WINDOWS[self.name]
-        now   = time.time()
+    @property
+    def client(self):
+        """Provider client for the API key reserved by the current request (the first key otherwise)."""
+        return self.clients[getattr(self._key_slot, "index", 0)]
 
-        # drop timestamps older than 60 s
-        while win and now - win[0] >= 60:
-            win.popleft()
+    def _block_if_needed(self) -> int:
+        """
+        Ensure this model stays below its RPM on every API key.
+        Called immediately before every network request; safe to call from
+        several worker threads at once. Each model keeps one token bucket
+        per key (refilled at rpm/60 tokens per second, capped at rpm), each
+        with its own lock, so calls to different models never contend. Keys
+        are tried round-robin and the first with a token wins; only blocks
+        when every key is empty, and then just until the next token arrives.
 
-        if len(win) >= rpm:
-            sleep_for = 60 - (now - win[0]) + 0.01  # small buffer
+        Returns:
+            Index of the key whose token was taken
+        """
+        rpm = BaseModel._RATE_LIMITS[self.name]
+        buckets = BaseModel._BUCKETS[self.name]
+
+        while True:
+            start = next(self._next_key)
+            sleep_for = None
+            for offset in range(len(buckets)):
+                index = (start + offset) % len(buckets)
+                bucket = buckets[index]
+                with bucket["lock"]:
+                    now = time.monotonic()
+                    bucket["tokens"] = min(rpm, bucket["tokens"] + (now - bucket["last"]) * rpm / 60)
+                    bucket["last"] = now
+
+                    if bucket["tokens"] >= 1:
+                        # claim the token before releasing the lock
+                        bucket["tokens"] -= 1
+                        return index
+
+                    wait = (1 - bucket["tokens"]) * 60 / rpm
+                    sleep_for = wait if sleep_for is None else min(sleep_for, wait)
+
+            # sleep outside the locks so other threads can refill/check
             print(f"[{self.name}] ⏳  rate limit reached. Sleeping {sleep_for:.1f}s")
             time.sleep(sleep_for)
-            # after sleep, purge again
-            now = time.time()
-            while win and now - win[0] >= 60:
-                win.popleft()
-
-        win.append(now)
 
     def generate(
         self,
@@ -96,8 +234,6 @@ class BaseModel:
                 - updated_messages: The updated message history including the new response
         """
 
-        self._block_if_needed()
-
         # Normalize input
         if isinstance(prompt_or_messages, str):
             # Delegate to specialised helper so subclasses can customise message
@@ -112,8 +248,41 @@ class BaseModel:
             if image_urls:
                 print("[WARN] image_urls were provided but prompt_or_messages is already a list. Ignoring image_urls.")
 
-        # Call the provider-specific implementation
-        text, metadata, raw = self._call_model(messages, mode, system_prompt)
+        # Every provider runs at temperature 0, so identical requests can be replayed
+        # from the cache or shared with an identical call already in flight
+        request_key = LLMCache.make_key(getattr(self, "model", self.name), messages, system_prompt, mode)
+        if BaseModel._CACHE is not None:
+            cached = BaseModel._CACHE.get(request_key)
+            if cached is not None:
+                messages.append({"role": "assistant", "content": cached["text"]})
+                return cached["text"], {"cached": True}, {}, messages
+
+        with BaseModel._LOCK:
+            inflight = BaseModel._INFLIGHT.get(request_key)
+            if inflight is None:
+                inflight = BaseModel._INFLIGHT[request_key] = Future()
+                leader = True
+            else:
+                leader = False
+
+        if leader:
+            try:
+                self._key_slot.index = self._block_if_needed()
+
+                # Call the provider-specific implementation
+                text, metadata, raw = self._call_model(messages, mode, system_prompt)
+                if BaseModel._CACHE is not None and not _is_failed_response(text):
+                    BaseModel._CACHE.set(request_key, text)
+                inflight.set_result((text, metadata, raw))
+            except BaseException as e:
+                inflight.set_exception(e)
+                raise
+            finally:
+                with BaseModel._LOCK:
+                    del BaseModel._INFLIGHT[request_key]
+        else:
+            # Same request already running on another thread: wait for its answer
+            text, metadata, raw = inflight.result()
 
         # Append assistant turn to history
         messages.append({"role": "assistant", "content": text})
@@ -149,8 +318,10 @@ class BaseModel:
 # OpenAI implementation
 class OpenAIModel(BaseModel):
     def __init__(self, name: str, model: str):
-        super().__init__(name)
-        openai.api_key = API_KEYS["openai"]["api_key"]
+        keys = _provider_keys("openai")
+        super().__init__(name, len(keys))
+        # One client per key and model: its httpx pool keeps connections warm across calls
+        self.clients = [OpenAI(api_key=key) for key in keys]
         self.model = model
 
     # --------------------------------------------------------------
@@ -181,8 +352,27 @@ class OpenAIModel(BaseModel):
         mode: str,
         system_prompt: Optional[str] = None
     ) -> Tuple[str, Dict, Dict]:
-        client = OpenAI()
+        params = self._request_params(messages, mode, system_prompt)
+
+        try:
+            resp = self.client.responses.create(**params)
+        except Exception as e:
+            return f"[ERROR] OpenAI request failed ({e})", {}, {}
+
+        text = getattr(resp, "output_text", None)
+        if not text:
+            return "[ERROR] Empty response from OpenAI", {}, resp.__dict__
+
+        metadata = getattr(resp, "output", {})
+        return text.strip(), metadata, resp
 
+    def _request_params(
+        self,
+        messages: List[Dict[str, str]],
+        mode: str,
+        system_prompt: Optional[str] = None
+    ) -> Dict[str, object]:
+        """Body of a Responses API request (shared by live and batch calls)."""
         params: Dict[str, object] = {
             "model": self.model,
             "input": messages,  # `input` accepts list of message dicts (text or multimodal)
@@ -198,24 +388,95 @@ class OpenAIModel(BaseModel):
         # include web-search tool if requested (feature-gated; may require beta access)
         if mode == "web-search":
             params["tools"] = [{"type": "web_search_preview"}]
+        return params
 
-        try:
-            resp = client.responses.create(**params)
-        except Exception as e:
-            return f"[ERROR] OpenAI request failed ({e})", {}, {}
+    # --------------------------------------------------------------
+    # Batch API: offline jobs at half price, no per-call RPM blocking.
+    # Batches belong to an account, so submit and poll both use the first key.
+    # --------------------------------------------------------------
+    def submit_batch(
+        self,
+        items: List[Tuple[str, str, Optional[List[str]]]],
+        mode: str = "standard",
+        system_prompt: Optional[str] = None
+    ) -> str:
+        """
+        Submit many prompts as one OpenAI Batch job.
 
-        text = getattr(resp, "output_text", None)
-        if not text:
-            return "[ERROR] Empty response from OpenAI", {}, resp.__dict__
+        Args:
+            items: (custom_id, prompt, image_urls) per request
+            mode: The generation mode (e.g., "standard", "web-search")
+            system_prompt: Optional system prompt applied to every request
 
-        metadata = getattr(resp, "output", {})
-        return text.strip(), metadata, resp
+        Returns:
+            The batch ID, to pass to poll_batch()
+        """
+        lines = [
+            orjson.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/responses",
+                "body": self._request_params(
+                    [self._build_user_message(prompt, image_urls)], mode, system_prompt
+                ),
+            })
+            for custom_id, prompt, image_urls in items
+        ]
+        batch_file = self.clients[0].files.create(file=("batch.jsonl", b"\n".join(lines)), purpose="batch")
+        batch = self.clients[0].batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/responses",
+            completion_window="24h",
+        )
+        print(f"[{self.name}] submitted batch {batch.id} with {len(items)} requests")
+        return batch.id
+
+    def poll_batch(self, batch_id: str, interval: float = 30.0) -> Dict[str, str]:
+        """
+        Wait for a batch submitted with submit_batch() and collect its answers.
+
+        Returns:
+            {custom_id: text}; failed requests map to an "[ERROR] ..." string
+        """
+        while True:
+            batch = self.clients[0].batches.retrieve(batch_id)
+            if batch.status in ("completed", "failed", "expired", "cancelled"):
+                break
+            time.sleep(interval)
+
+        # Successful requests land in the output file, failed ones in the error file
+        file_ids = [fid for fid in (batch.output_file_id, batch.error_file_id) if fid]
+        if not file_ids:
+            raise RuntimeError(
+                f"OpenAI batch {batch_id} ended with status '{batch.status}' and produced no "
+                f"output or error file ({getattr(batch, 'errors', None)})"
+            )
+
+        results: Dict[str, str] = {}
+        for file_id in file_ids:
+            for line in self.clients[0].files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                row = orjson.loads(line)
+                response = row.get("response") or {}
+                if response.get("status_code") != 200:
+                    results[row["custom_id"]] = f"[ERROR] OpenAI batch request failed ({row.get('error') or response})"
+                    continue
+                # Raw Responses API JSON has no `output_text` convenience field
+                text = "".join(
+                    block.get("text", "")
+                    for item in response["body"].get("output", []) if item.get("type") == "message"
+                    for block in item.get("content", []) if block.get("type") == "output_text"
+                ).strip()
+                results[row["custom_id"]] = text or "[ERROR] Empty response from OpenAI"
+        return results
 
 class AnthropicModel(BaseModel):
     def __init__(self, name, model):
-        super().__init__(name)
-        
-        self.client = anthropic.Anthropic( api_key = API_KEYS["anthropic"]["api_key"])
+        keys = _provider_keys("anthropic")
+        super().__init__(name, len(keys))
+
+        self.clients = [anthropic.Anthropic(api_key=key) for key in keys]
         self.model  = model
 
     def _call_model(
@@ -224,16 +485,7 @@ class AnthropicModel(BaseModel):
         mode: str,
         system_prompt: Optional[str] = None
     ) -> Tuple[str, Dict, Dict]:
-        kwargs = {
-            "model": self.model,
-            "messages": messages,
-            "max_tokens": 1024,
-            "temperature": 0,
-        }
-        if system_prompt:
-            kwargs["system"] = system_prompt
-
-        resp = self.client.messages.create(**kwargs)
+        resp = self.client.messages.create(**self._request_params(messages, system_prompt))
         metadata = {
             "model":     getattr(resp, "model", None),
             "usage":     getattr(resp, "usage", {}),
@@ -247,6 +499,75 @@ class AnthropicModel(BaseModel):
 
         return text, metadata, resp
 
+    def _request_params(
+        self,
+        messages: List[Dict[str, str]],
+        system_prompt: Optional[str] = None
+    ) -> Dict[str, object]:
+        """Messages API parameters (shared by live and batch calls)."""
+        kwargs = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": 1024,
+            "temperature": 0,
+        }
+        if system_prompt:
+            kwargs["system"] = system_prompt
+        return kwargs
+
+    # --------------------------------------------------------------
+    # Message Batches API: offline jobs at half price (first key only).
+    # --------------------------------------------------------------
+    def submit_batch(
+        self,
+        items: List[Tuple[str, str, Optional[List[str]]]],
+        mode: str = "standard",
+        system_prompt: Optional[str] = None
+    ) -> str:
+        """
+        Submit many prompts as one Anthropic Message Batch.
+
+        Args:
+            items: (custom_id, prompt, image_urls) per request
+            mode: Unused; kept for the same signature as OpenAIModel.submit_batch
+            system_prompt: Optional system prompt applied to every request
+
+        Returns:
+            The batch ID, to pass to poll_batch()
+        """
+        batch = self.clients[0].messages.batches.create(requests=[
+            {
+                "custom_id": custom_id,
+                "params": self._request_params(
+                    [self._build_user_message(prompt, image_urls)], system_prompt
+                ),
+            }
+            for custom_id, prompt, image_urls in items
+        ])
+        print(f"[{self.name}] submitted batch {batch.id} with {len(items)} requests")
+        return batch.id
+
+    def poll_batch(self, batch_id: str, interval: float = 30.0) -> Dict[str, str]:
+        """
+        Wait for a batch submitted with submit_batch() and collect its answers.
+
+        Returns:
+            {custom_id: text}; failed requests map to an "[ERROR] ..." string
+        """
+        while self.clients[0].messages.batches.retrieve(batch_id).processing_status != "ended":
+            time.sleep(interval)
+
+        results: Dict[str, str] = {}
+        for entry in self.clients[0].messages.batches.results(batch_id):
+            if entry.result.type != "succeeded":
+                results[entry.custom_id] = f"[ERROR] Anthropic batch request {entry.result.type}"
+                continue
+            results[entry.custom_id] = "".join(
+                block.text for block in entry.result.message.content
+                if getattr(block, "type", None) == "text"
+            ).strip()
+        return results
+
     # --------------------------------------------------------------
     # Provider-specific message builder to support image inputs.
     # --------------------------------------------------------------
@@ -270,25 +591,22 @@ class AnthropicModel(BaseModel):
             content_blocks.append({"type": "text", "text": text})
 
         if image_urls:
+            # Fetch remote/local images concurrently up front; data URIs need no I/O
+            to_load = [url for url in image_urls if not url.startswith("data:")]
+            loaded = dict(zip(to_load, _load_images(to_load)))
+
             for url in image_urls:
                 try:
                     if url.startswith("data:"):
-                        # Already a data URI – extract metadata.
-                        header, data_part = url.split(",", 1)
+                        # Already a data URI – reuse its payload without re-encoding.
+                        header, encoded_data = url.split(",", 1)
                         media_type = header.split(";")[0][5:] if ";" in header else "image/jpeg"
-                        encoded_data = data_part
-                    elif url.startswith("http"):
-                        # Fetch the remote image and encode.
-                        response = requests.get(url, timeout=10)
-                        response.raise_for_status()
-                        media_type = response.headers.get("Content-Type", "image/jpeg")
-                        encoded_data = base64.b64encode(response.content).decode("utf-8")
                     else:
-                        # Assume it's a local file path.
-                        with open(url, "rb") as f:
-                            data = f.read()
-                        media_type = "image/jpeg"  # best guess; callers should prefer data URI
-                        encoded_data = base64.b64encode(data).decode("utf-8")
+                        # Remote URL or local file path (both cached).
+                        if isinstance(loaded[url], Exception):
+                            raise loaded[url]
+                        image_bytes, media_type = loaded[url]
+                        encoded_data = _base64_image(image_bytes)
 
                     content_blocks.append({
                         "type": "image",
@@ -304,9 +622,12 @@ class AnthropicModel(BaseModel):
         return {"role": "user", "content": content_blocks}
 
 class GeminiModel(BaseModel):
+    MAX_RETRIES = 3  # retries on HTTP 429 before giving up
+
     def __init__(self, name, model):
-        super().__init__(name)
-        self.client = genai.Client(api_key=API_KEYS["gemini"]["api_key"])
+        keys = _provider_keys("gemini")
+        super().__init__(name, len(keys))
+        self.clients = [genai.Client(api_key=key) for key in keys]
         self.model  = model
 
     # --------------------------------------------------------------
@@ -323,25 +644,11 @@ class GeminiModel(BaseModel):
 
         parts: List[Part] = [Part(text=text)]
 
-        for url in image_urls:
+        for url, loaded in zip(image_urls, _load_images(image_urls)):
             try:
-                # Determine byte payload and mime type
-                if url.startswith("data:"):
-                    header, data_part = url.split(",", 1)
-                    mime_type = header.split(";")[0][5:]
-                    image_bytes = base64.b64decode(data_part)
-                elif url.startswith("http"):
-                    response = requests.get(url, timeout=10)
-                    response.raise_for_status()
-                    mime_type = response.headers.get("Content-Type", "image/jpeg")
-                    image_bytes = response.content
-                else:
-                    # local file path
-                    mime_type, _ = mimetypes.guess_type(url)
-                    mime_type = mime_type or "image/jpeg"
-                    with open(url, "rb") as f:
-                        image_bytes = f.read()
-
+                if isinstance(loaded, Exception):
+                    raise loaded
+                image_bytes, mime_type = loaded
                 parts.append(Part.from_bytes(data=image_bytes, mime_type=mime_type))
             except Exception as e:
                 print(f"[WARN] Gemini: failed to process image '{url}' – {e}. Skipping.")
@@ -397,34 +704,55 @@ class GeminiModel(BaseModel):
             # Gemini SDK uses `system_instruction` for system prompts
             config_kwargs["system_instruction"] = system_prompt
 
-        try:
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=content_objects,
-                config=GenerateContentConfig(**config_kwargs)
-            )
-        except errors.APIError as e:
-            print(e.code)
-            print(e.message)
-            return f"[ERROR] Gemini APIError {e.code}: {e.message}", {}, {}
+        for attempt in range(self.MAX_RETRIES + 1):
+            try:
+                response = self.client.models.generate_content(
+                    model=self.model,
+                    contents=content_objects,
+                    config=GenerateContentConfig(**config_kwargs)
+                )
+                break
+            except errors.APIError as e:
+                # Quota exceeded: back off exponentially (with jitter) and retry
+                if e.code == 429 and attempt < self.MAX_RETRIES:
+                    backoff = 2 ** attempt + random.random()
+                    print(f"[{self.name}] 429 from Gemini. Retrying in {backoff:.1f}s")
+                    time.sleep(backoff)
+                    # A retry is a new request: take a token like any other call,
+                    # possibly on a different key (self.client follows the slot)
+                    self._key_slot.index = self._block_if_needed()
+                    continue
+                print(e.code)
+                print(e.message)
+                return f"[ERROR] Gemini APIError {e.code}: {e.message}", {}, {}
 
         # ----------- Parse response -------------
-        if not getattr(response, "candidates", None):
-            return "[ERROR] Gemini returned no candidates", {}, response
+        # Fast path for the usual well-formed response; the checks below only
+        # run to explain what is missing when it fails
+        try:
+            cand = response.candidates[0]
+            text = "".join(p.text for p in cand.content.parts if p.text).strip()
+        except (AttributeError, IndexError, TypeError):
+            text = ""
+
+        if not text:
+            if not getattr(response, "candidates", None):
+                return "[ERROR] Gemini returned no candidates", {}, response
+
+            cand = response.candidates[0]
+            if not getattr(cand, "content", None):
+                return "[ERROR] Candidate had no content", {}, response
 
-        cand = response.candidates[0]
-        if not getattr(cand, "content", None):
-            return "[ERROR] Candidate had no content", {}, response
+            parts = getattr(cand.content, "parts", None)
+            if not parts:
+                return "[ERROR] Candidate content.parts empty", {}, response
 
-        parts = getattr(cand.content, "parts", None)
-        if not parts:
-            return "[ERROR] Candidate content.parts empty", {}, response
+            text_chunks = [getattr(p, "text", "") for p in parts if getattr(p, "text", "")]
+            if not text_chunks:
+                return "[ERROR] No text parts in response", {}, response
 
-        text_chunks = [getattr(p, "text", "") for p in parts if getattr(p, "text", "")]
-        if not text_chunks:
-            return "[ERROR] No text parts in response", {}, response
+            text = "".join(text_chunks).strip()
 
-        text = "".join(text_chunks).strip()
         metadata = {}
         if hasattr(cand, 'grounding_metadata') and hasattr(cand.grounding_metadata, 'search_entry_point'):
             metadata['search_content'] = cand
@@ -436,6 +764,9 @@ def create_models(model_configs):
     models = {}
     for cfg in model_configs:
         name, prov = cfg["name"], cfg["provider"]
+        # Optional per-model requests-per-minute quota (defaults to 10)
+        if cfg.get("rpm"):
+            BaseModel.set_rate_limit(name, int(cfg["rpm"]))
         if prov == "openai":
             models[name] = OpenAIModel(name, cfg["model"])
         elif prov == "anthropic":
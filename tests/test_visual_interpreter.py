@@ -0,0 +1,60 @@
+import io
+import sys
+from pathlib import Path
+
+import pytest
+
+# The src modules import each other by bare name (e.g. `from utils import ...`)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+Image = pytest.importorskip("PIL.Image")
+try:
+    visual_interpreter = pytest.importorskip("visual_interpreter")
+except FileNotFoundError as e:
+    # The module loads configs/api_keys.yml at import time
+    pytest.skip(str(e), allow_module_level=True)
+
+MAX_IMAGE_SIDE = visual_interpreter.MAX_IMAGE_SIDE
+
+# EXIF tag 0x0112; 6 means "rotate 90 degrees clockwise to display"
+EXIF_ORIENTATION = 0x0112
+RED = (255, 0, 0)
+BLUE = (0, 0, 255)
+
+
+def _rotated_photo_bytes() -> bytes:
+    """3000x2000 JPEG stored sideways (red top half, blue bottom half) with Orientation=6"""
+    img = Image.new("RGB", (3000, 2000), BLUE)
+    img.paste(RED, (0, 0, 3000, 1000))
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = 6
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", exif=exif)
+    return buf.getvalue()
+
+
+def _close_to(pixel, color, tolerance=40):
+    return all(abs(a - b) <= tolerance for a, b in zip(pixel, color))
+
+
+def test_downscale_applies_exif_orientation():
+    data, mime_type = visual_interpreter._downscale_image(_rotated_photo_bytes(), "image/jpeg")
+
+    assert mime_type == "image/jpeg"
+    img = Image.open(io.BytesIO(data)).convert("RGB")
+    # Displayed upright the photo is portrait, so the long side is now the height
+    width, height = img.size
+    assert height == MAX_IMAGE_SIDE
+    assert width < height
+    # Rotating clockwise moves the stored top (red) half to the right
+    assert _close_to(img.getpixel((width * 9 // 10, height // 2)), RED)
+    assert _close_to(img.getpixel((width // 10, height // 2)), BLUE)
+
+
+def test_small_images_are_returned_unchanged():
+    buf = io.BytesIO()
+    Image.new("RGB", (100, 50), RED).save(buf, format="PNG")
+
+    data, mime_type = visual_interpreter._downscale_image(buf.getvalue(), "image/png")
+
+    assert (data, mime_type) == (buf.getvalue(), "image/png")